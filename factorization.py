@@ -1,29 +1,273 @@
-from goldbach import PrimeGenerator
+from collections import namedtuple
+from math import gcd
+import random
+import threading
+import numpy as np
+from goldbach import shared_primes
+
+
+class SmallestPrimeFactorTable:
+    def __init__(self, n=2, max_n=1 << 27):
+        """
+        thread-safe table of the smallest prime factor of every integer below n, grown on demand
+        :param n: initial ceil for the table (excluded)
+        :param max_n: int, largest ceil the table may grow to, which bounds its memory to about 4 * max_n bytes
+        """
+        self.n = 0
+        self.max_n = max_n
+        self._spf = np.zeros(0, dtype=np.int32)
+        self._lock = threading.Lock()
+        self.extend(n)
+
+    @staticmethod
+    def sieve(n):
+        """
+        compute the smallest prime factor of every integer below n
+        each prime p up to sqrt(n) claims, in one vectorized step, the multiples of p not claimed by a smaller prime;
+        whatever is left unclaimed is prime and is its own smallest factor
+        :param n: ceil for the table (excluded)
+        :return: np.ndarray, spf[i] is the smallest prime factor of i for i >= 2, 0 for i < 2
+        """
+        spf = np.zeros(max(n, 0), dtype=np.int32 if n <= np.iinfo(np.int32).max else np.int64)
+        for p in shared_primes.primes_below(int(np.sqrt(max(n, 0))) + 1).tolist():
+            multiples = spf[p * p::p]
+            multiples[multiples == 0] = p
+
+        unclaimed = np.flatnonzero(spf == 0)
+        unclaimed = unclaimed[unclaimed >= 2]
+        spf[unclaimed] = unclaimed
+        return spf
+
+    def extend(self, n):
+        """
+        grow the table so that it covers every integer below n; the bound at least doubles on each extension
+        :param n: new ceil for the table (excluded)
+        :return: bool, whether the table covers n afterwards; False if n is beyond self.max_n
+        """
+        if n <= self.n:
+            return True
+        if n > self.max_n:
+            return False
+
+        with self._lock:
+            if n > self.n:
+                new_n = min(max(n, 2 * self.n), self.max_n)
+                self._spf = SmallestPrimeFactorTable.sieve(new_n)
+                self.n = new_n
+        return True
+
+    @property
+    def table(self):
+        """fetch the smallest-prime-factor array covering every integer below self.n"""
+        return self._spf
+
+
+# process-wide smallest-prime-factor table shared by every factorizer
+shared_spf = SmallestPrimeFactorTable()
+
+# Miller-Rabin with these bases is deterministic for every n below 3.3 * 10^24, which covers all 64-bit integers
+_MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+
+def is_probable_prime(n, extra_rounds=8):
+    """
+    Miller-Rabin primality test
+    the answer is exact below 3.3 * 10^24; beyond that `extra_rounds` random bases are added, and a composite
+    passes with probability below 4 ** -(13 + extra_rounds)
+    :param n: int
+    :param extra_rounds: int, number of random bases tried on top of the fixed ones for very large n
+    :return: bool
+    """
+    n = int(n)
+    if n < 2:
+        return False
+    for p in _MILLER_RABIN_BASES:
+        if n % p == 0:
+            return n == p
+
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+
+    bases = list(_MILLER_RABIN_BASES)
+    if n >= 3317044064679887385961981:
+        rng = random.Random(n)
+        bases += [rng.randrange(2, n - 1) for _ in range(extra_rounds)]
+
+    for a in bases:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def pollard_brent(n, seed=0, batch=128):
+    """
+    find a non-trivial divisor of a composite n with Brent's variant of Pollard's rho algorithm
+    gcds are taken once per `batch` steps on the accumulated product of differences, backtracking if that
+    product collapses to n; a failing polynomial is retried with another random constant
+    :param n: int, an odd composite
+    :param seed: seed of the random polynomial constants and starting points
+    :param batch: int, number of steps between two gcd computations
+    :return: int, a divisor d of n with 1 < d < n
+    """
+    n = int(n)  # python ints cannot overflow in x * x % n
+    rng = random.Random(seed)
+    while True:
+        c, y = rng.randrange(1, n), rng.randrange(0, n)
+        g, r, q = 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(batch, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += batch
+            r *= 2
+
+        if g == n:  # overshot: redo the last batch one step at a time
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+
+        if g != n:
+            return g
+
+
+class FactorArrays(namedtuple("FactorArrays", ["indptr", "primes", "exponents"])):
+    """
+    factorizations of a sequence of integers in CSR layout
+    the factorization of the i-th integer is primes[indptr[i]:indptr[i + 1]] ** exponents[indptr[i]:indptr[i + 1]],
+    with primes in ascending order; 1 has an empty factorization
+    """
+
+    def __len__(self):
+        """number of factorized integers"""
+        return self.indptr.shape[0] - 1
+
+    def factor_count(self, i):
+        """fetch the factorization of the i-th integer as a {prime: exponent} dict"""
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return dict(zip(self.primes[start:stop].tolist(), self.exponents[start:stop].tolist()))
 
 
 class Factorizer:
-    def __init__(self, n):
-        """an agent that factorize a given integer"""
-        if n <= 0:
+    # integers below this bound are factorized with the smallest-prime-factor table when engine="auto"
+    sieve_limit = 1 << 22
+    # primes below this bound are divided out before Miller-Rabin and Pollard's rho take over
+    trial_division_limit = 1 << 10
+
+    def __init__(self, n, engine="auto"):
+        """
+        an agent that factorize a given integer
+        :param n: positive int
+        :param engine: "sieve" (smallest-prime-factor table, memory proportional to n), "rho" (trial division,
+        Miller-Rabin and Pollard's rho, no memory proportional to n), or "auto" to choose by magnitude
+        """
+        if n <= 0 or n != int(n):
             raise ValueError("only positive integers can be passed")
+        n = int(n)  # numpy integers would overflow, or be rejected by pow(), in Miller-Rabin and Pollard's rho
+        if engine not in ("auto", "sieve", "rho"):
+            raise ValueError("unknown engine {}, expected 'auto', 'sieve' or 'rho'".format(engine))
+
+        if engine == "auto":
+            engine = "sieve" if n < max(Factorizer.sieve_limit, shared_spf.n) else "rho"
 
         self.n = n
-        self._primes = PrimeGenerator(n + 1).primes
+        self.engine = engine
         self._factor_count = {}
 
+    @staticmethod
+    def factorize_many(numbers):
+        """
+        factorize many integers at once by repeated lookups in the shared smallest-prime-factor table
+        every round divides each unfinished integer by its smallest prime factor, so the number of rounds is the
+        largest number of prime factors (with multiplicity) among the inputs
+        :param numbers: array-like of positive integers, below shared_spf.max_n
+        :return: FactorArrays
+        """
+        numbers = np.asarray(numbers).ravel()  # integers past int64 stay python ints in an object array
+        if np.any(numbers <= 0):
+            raise ValueError("only positive integers can be passed")
+
+        bound = int(numbers.max()) + 1 if numbers.size else 0
+        if bound > shared_spf.max_n or not shared_spf.extend(bound):
+            raise ValueError("cannot factorize numbers beyond {} with the smallest-prime-factor table".format(
+                shared_spf.max_n))
+        spf = shared_spf.table
+
+        numbers = numbers.astype(np.int64)
+        remaining = numbers.copy()
+        active = np.flatnonzero(remaining > 1)
+        owners, primes = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        while active.size:
+            p = spf[remaining[active]].astype(np.int64)
+            owners.append(active)
+            primes.append(p)
+            remaining[active] //= p
+            active = active[remaining[active] > 1]
+
+        # group by integer; a stable sort keeps each integer's factors in the (ascending) order they were found
+        owners, primes = np.concatenate(owners), np.concatenate(primes)
+        order = np.argsort(owners, kind="stable")
+        owners, primes = owners[order], primes[order]
+
+        # run-length encode repeated (integer, prime) pairs into exponents
+        starts = np.ones(owners.shape, dtype=bool)
+        starts[1:] = (owners[1:] != owners[:-1]) | (primes[1:] != primes[:-1])
+        starts = np.flatnonzero(starts)
+        exponents = np.diff(np.append(starts, owners.shape[0]))
+
+        indptr = np.zeros(numbers.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners[starts], minlength=numbers.shape[0]), out=indptr[1:])
+        return FactorArrays(indptr, primes[starts], exponents)
+
     def factorize(self):
         """factorize self.n into the product of a sequence of primes"""
         if self.n == 1:
             self._factor_count = {1: 1}
             return
 
-        n = self.n  # avoid changing self.n during factorization
-        for p in self._primes:
+        if self.engine == "sieve":
+            self._factor_count = Factorizer.factorize_many([self.n]).factor_count(0)
+        else:
+            self._factorize_rho()
+
+        assert self._factor_count, "no factor counted"  # check internal correctness
+
+    def _factorize_rho(self):
+        """factorize self.n by trial division with small cached primes, then Miller-Rabin and Pollard's rho"""
+        n = self.n
+        for p in shared_primes.primes_below(Factorizer.trial_division_limit).tolist():
+            if p * p > n:
+                break
             while n % p == 0:
                 self._gather_factor(p)
                 n //= p
 
-        assert self._factor_count, "no factor counted"  # check internal correctness
+        pending = [n] if n > 1 else []
+        while pending:
+            m = int(pending.pop())
+            if m < Factorizer.trial_division_limit ** 2 or is_probable_prime(m):
+                # no prime below the trial division limit is left, so a small enough m must be prime
+                self._gather_factor(m)
+            else:
+                d = pollard_brent(m)
+                pending += [d, m // d]
+
+        self._factor_count = dict(sorted(self._factor_count.items()))
 
     def _gather_factor(self, factor):
         """register a factor to self._factor_count; increment count by 1 if already registered"""
@@ -1,27 +1,112 @@
+import os
 import numpy as np
 import keras.backend as K
 from keras.datasets.fashion_mnist import load_data
 from keras.models import Sequential
 from keras.layers import Conv2D, MaxPooling2D, Dense, Activation, Flatten
 from keras.optimizers import Adam
-from sklearn.preprocessing import OneHotEncoder
 
 
-def get_fashion_mnist(preprocess=True, normalise=True):
-    training_set, testing_set = load_data()
-    train_features, train_labels = training_set
-    test_features, test_labels = testing_set
+# file names of the uint8 .npy cache, in the order returned by load_data()
+CACHE_FILES = ("train_features.npy", "train_labels.npy", "test_features.npy", "test_labels.npy")
+
+
+def cache_fashion_mnist(directory=".fashion_mnist"):
+    """
+    convert the dataset to uint8 .npy files once, so later runs skip the keras archives
+    :param directory: str, cache directory
+    :return: list of str, paths of the cached arrays, in the order of CACHE_FILES
+    """
+    paths = [os.path.join(directory, file) for file in CACHE_FILES]
+    if all(os.path.exists(path) for path in paths):
+        return paths
+
+    os.makedirs(directory, exist_ok=True)
+    (train_features, train_labels), (test_features, test_labels) = load_data()
+    for path, array in zip(paths, (train_features, train_labels, test_features, test_labels)):
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, np.ascontiguousarray(array, dtype=np.uint8))
+        os.replace(tmp_path, path)  # a killed run never leaves a truncated cache behind
+    return paths
+
+
+def load_fashion_mnist(directory=".fashion_mnist", mmap=True):
+    """
+    :param directory: str, cache directory, filled on first use
+    :param mmap: bool, whether to memory-map the arrays read-only instead of reading them into memory
+    :return: train_features, train_labels, test_features, test_labels, raw uint8 arrays
+    """
+    return tuple(np.load(path, mmap_mode="r" if mmap else None) for path in cache_fashion_mnist(directory))
+
+
+def one_hot(labels, n_labels=10, dtype=np.float32):
+    """
+    :param labels: np.ndarray of int, shape (n,)
+    :param n_labels: int, number of classes
+    :param dtype: dtype of the encoding
+    :return: np.ndarray, shape (n, n_labels), dense one-hot encoding
+    """
+    encoded = np.zeros((len(labels), n_labels), dtype=dtype)
+    encoded[np.arange(len(labels)), labels] = 1
+    return encoded
+
+
+def iter_batches(features, labels, batch_size=64, shuffle=False, seed=None, epochs=1, normalise=True,
+                 channel_axis=-1, n_labels=10):
+    """
+    stream (features, one-hot labels) batches, converting each batch to float32 on the fly
+    only one batch is ever held in float32, so the full set can stay a uint8 memory map
+    :param features: np.ndarray or np.memmap of uint8, shape (n, height, width)
+    :param labels: np.ndarray or np.memmap of int, shape (n,)
+    :param batch_size: int, number of samples per batch; the last batch of an epoch may be smaller
+    :param shuffle: bool, whether to visit the samples in a new random order every epoch
+    :param seed: int or None, seed of the shuffling
+    :param epochs: int or None, number of passes over the data; None streams forever, as keras' fit_generator expects
+    :param normalise: bool, whether to scale values to [0, 1]
+    :param channel_axis: int or None, where to insert the channel axis of the features; None to insert none
+    :param n_labels: int, number of classes
+    :return: generator of (np.ndarray of float32, np.ndarray of float32)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(features)
+    epoch = 0
+    while epochs is None or epoch < epochs:
+        order = rng.permutation(n) if shuffle else None
+        for start in range(0, n, batch_size):
+            if order is None:
+                index = slice(start, start + batch_size)
+            else:
+                index = np.sort(order[start:start + batch_size])  # ascending reads are kinder to a memory map
+
+            batch = features[index].astype(np.float32)
+            if normalise:  # normalise values in [0, 1] to avoid non-convergence
+                batch *= np.float32(1 / 255)
+            if channel_axis is not None:
+                batch = np.expand_dims(batch, channel_axis)
+            yield batch, one_hot(labels[index], n_labels)
+        epoch += 1
+
+
+def get_fashion_mnist(preprocess=True, normalise=True, directory=".fashion_mnist"):
+    """
+    :param preprocess: bool, whether to add a trailing channel axis and one-hot encode the labels as float32
+    :param normalise: bool, whether to convert the features to float32 in [0, 1]; otherwise they stay uint8
+    :param directory: str, cache directory, filled on first use
+    :return: train_features, train_labels, test_features, test_labels
+    """
+    train_features, train_labels, test_features, test_labels = load_fashion_mnist(directory, mmap=False)
 
     if normalise:  # normalise values in [0, 1] to avoid non-convergence
-        train_features = train_features / 255.0
-        test_features = test_features / 255.0
+        train_features = train_features.astype(np.float32)
+        train_features *= np.float32(1 / 255)
+        test_features = test_features.astype(np.float32)
+        test_features *= np.float32(1 / 255)
 
     if preprocess:
-        encoder = OneHotEncoder()
         train_features = np.reshape(train_features, train_features.shape + (1,))
-        train_labels = encoder.fit_transform(train_labels.reshape(-1, 1))
+        train_labels = one_hot(train_labels)
         test_features = np.reshape(test_features, test_features.shape + (1,))
-        test_labels = encoder.fit_transform(test_labels.reshape(-1, 1))
+        test_labels = one_hot(test_labels)
 
     return train_features, train_labels, test_features, test_labels
 
@@ -52,7 +137,7 @@ def get_model(channels, height, width, labels, activation="relu"):
 
 
 if __name__ == '__main__':
-    train_features, train_labels, test_features, test_labels = get_fashion_mnist()
+    train_features, train_labels, test_features, test_labels = load_fashion_mnist()
     print("features for training, shape =", train_features.shape)
     print("labels  for training, shape =", train_labels.shape)
     print("features for testing, shape =", test_features.shape)
@@ -63,9 +148,22 @@ if __name__ == '__main__':
     print("using optimizer {}".format(optimizer))
     model.compile(optimizer, loss='categorical_crossentropy', metrics=['accuracy'])
 
-    # train and validate the model
-    model.fit(x=train_features, y=train_labels, batch_size=64, epochs=3, validation_split=0.3, shuffle=False)
+    # train and validate the model, holding out the last 30% of the training set as before
+    batch_size = 64
+    channel_axis = 1 if K.image_data_format() == "channels_first" else -1
+    n_train = int(len(train_features) * 0.7)
+    model.fit_generator(
+        iter_batches(train_features[:n_train], train_labels[:n_train], batch_size, epochs=None,
+                     channel_axis=channel_axis),
+        steps_per_epoch=-(-n_train // batch_size), epochs=3,
+        validation_data=iter_batches(train_features[n_train:], train_labels[n_train:], batch_size, epochs=None,
+                                     channel_axis=channel_axis),
+        validation_steps=-(-(len(train_features) - n_train) // batch_size),
+    )
 
     # test the model
-    scores = model.evaluate(x=test_features, y=test_labels)
+    scores = model.evaluate_generator(
+        iter_batches(test_features, test_labels, batch_size, channel_axis=channel_axis),
+        steps=-(-len(test_features) // batch_size),
+    )
     print("TESTING: cross-entropy = {}, top-1-accuracy={}".format(*scores))
@@ -0,0 +1,243 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+
+# settings swept by the benchmark, in the order they appear in a result
+CONFIG_KEYS = ("batch_size", "intra_threads", "inter_threads", "data_format", "dtype")
+
+
+def peak_rss_mb():
+    """
+    :return: float, peak resident set size of this process in MiB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10  # bytes on macOS, KiB on Linux
+
+
+def configure_backend(intra_threads, inter_threads, data_format, dtype):
+    """
+    apply the thread, data format and precision settings; must run before the first tensorflow op
+    :return: dict, versions of the libraries in use
+    """
+    import tensorflow as tf
+    import keras
+    import keras.backend as K
+
+    if hasattr(tf, "config") and hasattr(tf.config, "threading"):  # tensorflow 2
+        tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+    else:  # tensorflow 1 configures threads per session
+        config = tf.ConfigProto(intra_op_parallelism_threads=intra_threads,
+                                inter_op_parallelism_threads=inter_threads)
+        K.set_session(tf.Session(config=config))
+
+    K.set_image_data_format(data_format)
+    K.set_floatx(dtype)
+    if dtype == "float16":
+        K.set_epsilon(1e-4)  # the default 1e-7 underflows to 0 in float16
+    return {"tensorflow": tf.__version__, "keras": keras.__version__}
+
+
+def run_config(batch_size, intra_threads, inter_threads, data_format, dtype, steps=50, warmup=5, data="synthetic",
+               seed=0, started=None):
+    """
+    train get_model() for `warmup` + `steps` batches under one configuration and measure it
+    meant to run in a fresh process, since thread settings cannot change once tensorflow is initialised
+    :param batch_size: int, samples per training step
+    :param intra_threads: int, threads used within one op
+    :param inter_threads: int, ops run concurrently
+    :param data_format: str, "channels_last" or "channels_first"
+    :param dtype: str, "float32" or "float16", precision of the inputs and the model
+    :param steps: int, number of timed steps
+    :param warmup: int, number of untimed steps after the first one
+    :param data: str, "synthetic" for random images, "cached" for the Fashion-MNIST cache
+    :param seed: int, seed of the synthetic data and of the batch order
+    :param started: float or None, time.perf_counter() at process start; time to first batch is measured from it
+    :return: dict, measurements and the versions of the libraries in use
+    """
+    started = time.perf_counter() if started is None else started
+    versions = configure_backend(intra_threads, inter_threads, data_format, dtype)
+    from keras.optimizers import Adam
+    from fashion_mnist import get_model, iter_batches, load_fashion_mnist
+
+    if data == "synthetic":
+        rng = np.random.default_rng(seed)
+        n_samples = batch_size * 16
+        features = rng.integers(0, 256, (n_samples, 28, 28), dtype=np.uint8)
+        labels = rng.integers(0, 10, n_samples)
+    else:
+        features, labels = load_fashion_mnist()[:2]
+
+    channel_axis = 1 if data_format == "channels_first" else -1
+    batches = iter_batches(features, labels, batch_size, shuffle=True, seed=seed, epochs=None,
+                           channel_axis=channel_axis)
+
+    model = get_model(channels=1, height=28, width=28, labels=10)
+    model.compile(Adam(), loss="categorical_crossentropy")
+
+    x, y = next(batches)
+    model.train_on_batch(x.astype(dtype, copy=False), y.astype(dtype, copy=False))
+    time_to_first_batch = time.perf_counter() - started
+
+    latencies = []
+    for step in range(warmup + steps):
+        x, y = next(batches)
+        x, y = x.astype(dtype, copy=False), y.astype(dtype, copy=False)
+        start = time.perf_counter()
+        model.train_on_batch(x, y)
+        if step >= warmup:
+            latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    return {
+        "samples_per_sec": batch_size * len(latencies) / latencies.sum(),
+        "latency_ms": {"mean": latencies.mean() * 1e3, "p50": p50, "p90": p90, "p99": p99},
+        "peak_rss_mb": peak_rss_mb(),
+        "time_to_first_batch_s": time_to_first_batch,
+        "versions": versions,
+    }
+
+
+def run_isolated(config, settings, timeout=None):
+    """
+    run one configuration in a subprocess of this script
+    :param config: dict, values of CONFIG_KEYS
+    :param settings: dict, steps, warmup, data and seed
+    :param timeout: float or None, seconds after which the configuration is reported as failed
+    :return: dict, the configuration, its measurements, and an `error` that is None on success
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--run-config", json.dumps(dict(config, **settings))]
+    try:
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                                 timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return dict(config, error="timed out after {} s".format(timeout))
+
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        stderr = process.stderr.strip().splitlines()
+        return dict(config, error="exit code {}: {}".format(process.returncode, stderr[-1] if stderr else ""))
+    return dict(config, **json.loads(lines[-1]))
+
+
+def run_benchmark(batch_sizes, intra_threads, inter_threads, data_formats, dtypes, timeout=None, callback=None,
+                  **settings):
+    """
+    run every combination of the swept settings, each in its own process
+    :param batch_sizes: list of int
+    :param intra_threads: list of int
+    :param inter_threads: list of int
+    :param data_formats: list of str
+    :param dtypes: list of str
+    :param timeout: float or None, per-configuration timeout in seconds
+    :param callback: callable taking a result dict, called as each configuration finishes
+    :param settings: steps, warmup, data and seed, passed on to run_config()
+    :return: dict, JSON-serializable report with the environment, the settings and one result per configuration
+    """
+    environment = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    results = []
+    for values in itertools.product(batch_sizes, intra_threads, inter_threads, data_formats, dtypes):
+        result = run_isolated(dict(zip(CONFIG_KEYS, values)), settings, timeout)
+        result.setdefault("error", None)
+        environment.update(result.pop("versions", {}))
+        results.append(result)
+        if callback is not None:
+            callback(result)
+
+    return {"environment": environment, "settings": settings, "results": results}
+
+
+def compare(report, baseline, tolerance=0.1):
+    """
+    find configurations whose throughput dropped by more than `tolerance` relative to a baseline report
+    :param report: dict, output of run_benchmark()
+    :param baseline: dict, output of an earlier run_benchmark()
+    :param tolerance: float, allowed relative drop of samples/sec
+    :return: list of (config dict, baseline samples/sec, samples/sec), samples/sec being None if the config failed
+    """
+    def key(result):
+        return tuple(result[k] for k in CONFIG_KEYS)
+
+    previous = {key(result): result for result in baseline["results"] if result.get("error") is None}
+    regressions = []
+    for result in report["results"]:
+        if key(result) not in previous:
+            continue
+        before = previous[key(result)]["samples_per_sec"]
+        after = result.get("samples_per_sec")
+        if after is None or after < before * (1 - tolerance):
+            regressions.append(({k: result[k] for k in CONFIG_KEYS}, before, after))
+    return regressions
+
+
+def print_result(result):
+    """progress callback for run_benchmark() that summarizes each configuration on stderr"""
+    config = " ".join("{}={}".format(k, result[k]) for k in CONFIG_KEYS)
+    if result["error"] is not None:
+        print(config, "FAILED:", result["error"], file=sys.stderr)
+    else:
+        print(config, "{:.0f} samples/s, p50 {:.1f} ms".format(result["samples_per_sec"], result["latency_ms"]["p50"]),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description="training throughput benchmark of fashion_mnist.get_model")
+    parser.add_argument("-b", "--batch-sizes", default=[32, 64, 128], type=int, nargs="+")
+    parser.add_argument("-t", "--intra-threads", default=sorted({1, os.cpu_count() or 1}), type=int, nargs="+",
+                        help="threads used within one op")
+    parser.add_argument("-i", "--inter-threads", default=[1], type=int, nargs="+", help="ops run concurrently")
+    parser.add_argument("-f", "--data-formats", default=["channels_last", "channels_first"], nargs="+",
+                        choices=["channels_last", "channels_first"])
+    parser.add_argument("-p", "--dtypes", default=["float32", "float16"], nargs="+", choices=["float32", "float16"])
+    parser.add_argument("-s", "--steps", default=50, type=int, help="number of timed training steps")
+    parser.add_argument("-w", "--warmup", default=5, type=int, help="number of untimed steps before timing")
+    parser.add_argument("-d", "--data", default="synthetic", choices=["synthetic", "cached"],
+                        help="random images, which need no download, or the cached Fashion-MNIST training set")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--timeout", default=None, type=float, help="seconds allowed per configuration")
+    parser.add_argument("-o", "--output", default=None, help="path of the JSON report, stdout by default")
+    parser.add_argument("--baseline", default=None, help="JSON report of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", default=0.1, type=float, help="allowed relative drop of samples/sec")
+    parser.add_argument("--run-config", default=None, help=argparse.SUPPRESS)  # used by run_isolated()
+    args = parser.parse_args()
+
+    if args.run_config is not None:
+        print(json.dumps(run_config(started=started, **json.loads(args.run_config))))
+        sys.exit(0)
+
+    settings = {"steps": args.steps, "warmup": args.warmup, "data": args.data, "seed": args.seed}
+    report = run_benchmark(args.batch_sizes, args.intra_threads, args.inter_threads, args.data_formats, args.dtypes,
+                           timeout=args.timeout, callback=print_result, **settings)
+
+    if args.output is None:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print("warning: baseline was measured with different settings", baseline.get("settings"),
+                  file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for config, before, after in regressions:
+            print("regression:", config, "{:.0f} -> {} samples/s".format(
+                before, "failed" if after is None else "{:.0f}".format(after)), file=sys.stderr)
+        sys.exit(1 if regressions else 0)
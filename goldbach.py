@@ -1,4 +1,11 @@
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Value, shared_memory
+import os
+import struct
+import threading
+import time
 import numpy as np
 
 
@@ -7,31 +14,388 @@ def ceil(x):
     return int(np.ceil(x))
 
 
+# header of a saved sieve: magic, format version, flags (reserved), bound n, number of bitmap bytes
+SIEVE_FILE_MAGIC = b"PRIMEBMP"
+SIEVE_FILE_VERSION = 1
+_SIEVE_FILE_HEADER = struct.Struct("<8sIIQQ")
+
+
+def _base_primes(limit):
+    """
+    odd primes not exceeding limit, found with a plain (unsegmented) sieve
+    :param limit: int, inclusive upper bound, expected to be small (about the square root of a sieve bound)
+    :return: np.ndarray of int64
+    """
+    if limit < 3:
+        return np.zeros(0, dtype=np.int64)
+
+    flags = np.ones(limit + 1, dtype=bool)
+    flags[:2] = False
+    flags[4::2] = False
+    for i in range(3, int(np.sqrt(limit)) + 1, 2):
+        if flags[i]:
+            flags[i * i::2 * i] = False
+
+    return np.flatnonzero(flags)[1:].astype(np.int64)  # drop 2, only odd primes are sieved
+
+
+def _sieve_segment(start, stop, base_primes):
+    """
+    sieve the odd numbers 2 * i + 1 for i in [start, stop)
+    :param start: int, first odd index of the segment
+    :param stop: int, odd index past the end of the segment
+    :param base_primes: np.ndarray, every odd prime up to sqrt(2 * stop + 1) in ascending order
+    :return: np.ndarray of bool, True where 2 * i + 1 is prime
+    """
+    flags = np.ones(stop - start, dtype=bool)
+    low, high = 2 * start + 1, 2 * stop + 1
+
+    for p in base_primes:
+        p = int(p)
+        if p * p >= high:
+            break
+        # first odd multiple of p inside the segment, never below p * p
+        first = max(p * p, (low + p - 1) // p * p)
+        if first % 2 == 0:
+            first += p
+        flags[(first - low) // 2::p] = False
+
+    if start == 0:
+        flags[0] = False  # 1 is not a prime
+    return flags
+
+
 class PrimeGenerator:
-    def __init__(self, n):
+    def __init__(self, n, segment_size=1 << 18):
         """
         generator of prime numbers less than n
+        only odd numbers are sieved, one bit per odd number, in segments of `segment_size` odd numbers
         :param n: ceil for prime list (excluded)
+        :param segment_size: int, number of odd numbers sieved at a time, rounded up to a multiple of 8
         """
         self.n = n
+        self.segment_size = max(8, ceil(segment_size / 8) * 8)
+        self._bitmap = None
         self._primes = None
 
+    @property
+    def n_bits(self):
+        """number of odd numbers below self.n, i.e. the number of bits in the bitmap"""
+        return max(self.n, 0) // 2
+
     def generate_primes(self):
-        self._primes = list(range(2, self.n))
+        """run a segmented sieve of Eratosthenes and pack the result into self._bitmap"""
+        n_bits = self.n_bits
+        base_primes = _base_primes(int(np.sqrt(max(self.n, 0))) + 1)
+        bitmap = np.zeros(ceil(n_bits / 8), dtype=np.uint8)
 
-        for i in range(2, self.n):
-            for j in range(2, min(i, ceil(np.sqrt(i)) + 1)):
-                if i % j == 0:
-                    self._primes.pop(self._primes.index(i))
-                    break
+        for start in range(0, n_bits, self.segment_size):
+            stop = min(start + self.segment_size, n_bits)
+            flags = _sieve_segment(start, stop, base_primes)
+            bitmap[start // 8:ceil(stop / 8)] = np.packbits(flags, bitorder="little")
+
+        self._bitmap = bitmap
+        self._primes = None
 
     @property
-    def primes(self):
-        """fetch a list of prime numbers under self.n"""
-        if self._primes is None:
+    def bitmap(self):
+        """
+        fetch the packed sieve as an np.ndarray of uint8
+        bit (i % 8) of byte (i // 8), in little-endian bit order, is set iff 2 * i + 1 is prime
+        """
+        if self._bitmap is None:
             self.generate_primes()
+        return self._bitmap
+
+    def is_prime(self, x):
+        """
+        constant-time primality test against the sieve
+        :param x: int or array-like of ints, each less than self.n
+        :return: bool, or np.ndarray of bool if x is array-like
+        """
+        x = np.asarray(x, dtype=np.int64)
+        if np.any(x >= self.n):
+            raise ValueError("cannot test numbers beyond the sieve bound {}".format(self.n))
+
+        index = np.maximum(x, 0) >> 1
+        bits = (self.bitmap[index >> 3] >> (index & 7).astype(np.uint8)) & 1
+        result = ((bits == 1) & (x & 1 == 1)) | (x == 2)
+        return result if result.ndim else bool(result)
+
+    def save(self, path):
+        """
+        save the sieve to a binary file: a fixed-size header followed by the packed bitmap
+        :param path: str, path of the file to write
+        """
+        bitmap = self.bitmap
+        with open(path, "wb") as f:
+            f.write(_SIEVE_FILE_HEADER.pack(SIEVE_FILE_MAGIC, SIEVE_FILE_VERSION, 0, self.n, bitmap.nbytes))
+            f.write(np.ascontiguousarray(bitmap).tobytes())
+
+    @staticmethod
+    def load(path, mmap=True):
+        """
+        open a sieve saved by PrimeGenerator.save()
+        with mmap=True the bitmap is a read-only np.memmap, so loading is near-instant for any bound and the pages
+        are shared with every other process mapping the same file
+        :param path: str, path of the file to read
+        :param mmap: bool, whether to memory-map the bitmap instead of reading it into memory
+        :return: PrimeGenerator
+        """
+        with open(path, "rb") as f:
+            header = f.read(_SIEVE_FILE_HEADER.size)
+        if len(header) < _SIEVE_FILE_HEADER.size:
+            raise ValueError("truncated sieve file: {}".format(path))
+
+        magic, version, _, n, nbytes = _SIEVE_FILE_HEADER.unpack(header)
+        if magic != SIEVE_FILE_MAGIC:
+            raise ValueError("not a sieve file: {}".format(path))
+        if version != SIEVE_FILE_VERSION:
+            raise ValueError("unsupported sieve file version {} in {}".format(version, path))
+
+        generator = PrimeGenerator(n)
+        if nbytes != ceil(generator.n_bits / 8) or os.path.getsize(path) < _SIEVE_FILE_HEADER.size + nbytes:
+            raise ValueError("corrupted sieve file: {}".format(path))
+
+        if nbytes == 0:
+            generator._bitmap = np.zeros(0, dtype=np.uint8)
+        elif mmap:
+            generator._bitmap = np.memmap(path, dtype=np.uint8, mode="r", offset=_SIEVE_FILE_HEADER.size,
+                                          shape=(nbytes,))
+        else:
+            generator._bitmap = np.fromfile(path, dtype=np.uint8, count=nbytes, offset=_SIEVE_FILE_HEADER.size)
+        return generator
+
+    def iter_prime_arrays(self, chunk_bytes=1 << 16, n=None):
+        """
+        iterate over the primes under self.n in ascending order, one np.ndarray per chunk of the bitmap
+        :param chunk_bytes: int, number of bitmap bytes decoded at a time, which bounds the memory used
+        :param n: int or None, stop at this ceil (excluded) if it is below self.n; only the bitmap prefix covering
+                  it is decoded
+        """
+        n = self.n if n is None else min(n, self.n)
+        if n > 2:
+            yield np.array([2], dtype=np.int64)
+
+        bitmap = self.bitmap[:ceil(max(n, 0) / 16)]
+        for offset in range(0, bitmap.shape[0], chunk_bytes):
+            bits = np.unpackbits(bitmap[offset:offset + chunk_bytes], bitorder="little")
+            primes = 2 * (np.flatnonzero(bits).astype(np.int64) + 8 * offset) + 1
+            yield primes if offset + chunk_bytes < bitmap.shape[0] else primes[:np.searchsorted(primes, n)]
+
+    @property
+    def primes_array(self):
+        """fetch the prime numbers under self.n as an np.ndarray of int64"""
+        if self._primes is None:
+            self._primes = np.concatenate([np.zeros(0, dtype=np.int64)] + list(self.iter_prime_arrays()))
         return self._primes
 
+    @property
+    def primes(self):
+        """fetch a list of prime numbers under self.n"""
+        return self.primes_array.tolist()
+
+
+class PrimeTable(PrimeGenerator):
+    def __init__(self, n=2, segment_size=1 << 18, max_bytes=1 << 27):
+        """
+        thread-safe prime sieve that grows on demand, meant to be shared by every consumer in the process
+        growing the table only sieves the new segments; the bound is kept a multiple of 16 so that each
+        extension starts on a byte boundary of the bitmap
+        :param n: initial ceil for the table (excluded)
+        :param segment_size: int, number of odd numbers sieved at a time
+        :param max_bytes: int, memory ceiling for the bitmap plus the materialized prime array
+        """
+        super().__init__(0, segment_size)
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._bitmap = np.zeros(0, dtype=np.uint8)
+        self.extend(n)
+
+    @property
+    def max_n(self):
+        """largest bound the table may grow to without its bitmap exceeding self.max_bytes"""
+        return self.max_bytes * 16
+
+    @property
+    def nbytes(self):
+        """memory currently held by the table, in bytes"""
+        return self._bitmap.nbytes + (0 if self._primes is None else self._primes.nbytes)
+
+    def generate_primes(self):
+        """(re)build the table from scratch up to the current bound"""
+        with self._lock:
+            n, self.n = self.n, 0
+            self._bitmap = np.zeros(0, dtype=np.uint8)
+            self._primes = None
+            self.extend(n)
+
+    def extend(self, n):
+        """
+        grow the table so that it covers every number below n, sieving only the segments not covered yet
+        the bound at least doubles on each extension to amortize repeated small requests
+        :param n: new ceil for the table (excluded)
+        :return: bool, whether the table covers n afterwards; False if n is beyond self.max_n
+        """
+        if n <= self.n:
+            return True
+        if n > self.max_n:
+            return False
+
+        with self._lock:
+            if n <= self.n:  # another thread extended the table meanwhile
+                return True
+
+            new_n = min(max(n, 2 * self.n), self.max_n)
+            new_n = ceil(new_n / 16) * 16
+            old_bits, new_bits = self.n_bits, new_n // 2
+            base_primes = _base_primes(int(np.sqrt(new_n)) + 1)
+
+            bitmap = np.zeros(new_bits // 8, dtype=np.uint8)
+            bitmap[:self._bitmap.shape[0]] = self._bitmap
+            for start in range(old_bits, new_bits, self.segment_size):
+                stop = min(start + self.segment_size, new_bits)
+                flags = _sieve_segment(start, stop, base_primes)
+                bitmap[start // 8:stop // 8] = np.packbits(flags, bitorder="little")
+
+            if old_bits == 0:  # the array cannot have 2 yet, as the bitmap only covers odd numbers
+                self._primes = None
+            elif self._primes is not None:
+                bits = np.unpackbits(bitmap[old_bits // 8:], bitorder="little")
+                new_primes = 2 * (np.flatnonzero(bits).astype(np.int64) + old_bits) + 1
+                self._primes = np.concatenate([self._primes, new_primes])
+
+            # publish the bitmap before the bound so that readers never see a bound the bitmap does not cover
+            self._bitmap = bitmap
+            self.n = new_n
+            self._enforce_ceiling()
+        return True
+
+    def _enforce_ceiling(self):
+        """evict the materialized prime array whenever the table is over its memory ceiling"""
+        if self.nbytes > self.max_bytes:
+            self._primes = None
+
+    def evict(self):
+        """drop every materialized view of the table, keeping only the bitmap"""
+        with self._lock:
+            self._primes = None
+
+    def adopt(self, bitmap, n):
+        """
+        replace the table with an already sieved bitmap, e.g. one living in shared memory, without copying it
+        the bitmap is only read from; a later extension copies it into a new, private array
+        e.g. `shared_primes.adopt(PrimeGenerator.load(path).bitmap, n)` serves the table from a saved file
+        :param bitmap: np.ndarray of uint8, packed sieve as described in PrimeGenerator.bitmap
+        :param n: int, ceil covered by the bitmap (excluded), rounded down to a multiple of 16
+        """
+        n = n // 16 * 16
+        with self._lock:
+            self._bitmap = bitmap[:n // 16]
+            self._primes = None
+            self.n = n
+
+    def is_prime(self, x):
+        """
+        constant-time primality test, growing the table first if needed
+        :param x: int or array-like of ints
+        :return: bool, or np.ndarray of bool if x is array-like
+        """
+        bound = int(np.max(x)) + 1 if np.size(x) else 0
+        if not self.extend(bound):
+            return PrimeGenerator(bound).is_prime(x)
+        return super().is_prime(x)
+
+    @property
+    def primes_array(self):
+        """fetch the prime numbers under self.n as an np.ndarray of int64"""
+        with self._lock:
+            primes = super().primes_array
+            self._enforce_ceiling()
+        return primes
+
+    def primes_below(self, n):
+        """
+        fetch the prime numbers under n, growing the table first if needed
+        requests beyond self.max_n are served by a transient sieve and do not enter the table
+        :param n: ceil for prime list (excluded)
+        :return: np.ndarray of int64, a view into the table's prime array if it is materialized
+        """
+        if not self.extend(n):
+            return PrimeGenerator(n).primes_array
+
+        primes = self._primes
+        if primes is not None:
+            return primes[:np.searchsorted(primes, n)]
+        # only decode the prefix of the bitmap below n, rather than materializing the whole table
+        return np.concatenate([np.zeros(0, dtype=np.int64)] + list(self.iter_prime_arrays(n=n)))
+
+
+# process-wide prime table shared by every validator and factorizer
+shared_primes = PrimeTable()
+
+# per-process state of the workers spawned by Validator.validate_parallel()
+_worker_state = {}
+
+
+def _init_validation_worker(shm_name, n, first_failure):
+    """
+    attach a validation worker to the parent's prime table in shared memory
+    workers only read the shared bitmap; small primes are decoded lazily from it, see minimal_partitions()
+    :param shm_name: str, name of the shared memory block holding the bitmap, or None if there is no table
+    :param n: int, ceil covered by the shared bitmap (excluded)
+    :param first_failure: multiprocessing.Value, smallest failing run_id reported so far by any worker
+    """
+    _worker_state["first_failure"] = first_failure
+    if shm_name is None:
+        return
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state["shm"] = shm
+    shared_primes.adopt(np.ndarray((n // 16,), dtype=np.uint8, buffer=shm.buf), n)
+    # cap the worker's table at the shared bitmap: it never grows a private copy, and any prime array it
+    # happens to materialize is evicted straight away instead of being kept once per process
+    shared_primes.max_bytes = shared_primes.nbytes
+
+
+def _validate_shard(validator, start, stop, step):
+    """
+    check the runs in [start, stop) step by step, giving up as soon as another shard fails at an earlier run
+    :return: ShardTiming
+    """
+    first_failure = _worker_state["first_failure"]
+    begin = time.perf_counter()
+    failure, status = None, "passed"
+
+    for low in range(start, stop, step):
+        if first_failure.value <= low:
+            status = "cancelled"
+            break
+        failure = validator.first_failure(low, min(low + step, stop))
+        if failure is not None:
+            with first_failure.get_lock():
+                first_failure.value = min(first_failure.value, failure)
+            status = "failed"
+            break
+
+    return ShardTiming(start, stop, failure, status, time.perf_counter() - begin)
+
+
+# timing of one shard of Validator.validate_parallel(); status is "passed", "failed" or "cancelled"
+ShardTiming = namedtuple("ShardTiming", ["start", "stop", "failure", "status", "seconds"])
+
+
+class ValidationReport(namedtuple("ValidationReport", ["n_runs", "first_failure", "first_failing_k", "shards"])):
+    @property
+    def success(self):
+        """whether the statement holds for every run"""
+        return self.first_failure is None
+
+    @property
+    def seconds(self):
+        """total worker time spent over all shards"""
+        return sum(shard.seconds for shard in self.shards)
+
 
 class Validator(ABC):
     def __init__(self):
@@ -49,6 +413,9 @@ class Validator(ABC):
         :param verbose: verbosity (level) to be passed to self.argument()
         :return: bool, truth of all statement
         """
+        if not verbose:
+            return self.first_failure(0, n_runs) is None
+
         for run in range(n_runs):
             if self.statement(self.__class__.map_run_id(run), verbose=verbose):
                 if verbose and (run + 1) % 5 == 0 or run == n_runs - 1:
@@ -58,6 +425,81 @@ class Validator(ABC):
 
         return True
 
+    def validate_parallel(self, n_runs, n_workers=None, n_shards=None):
+        """
+        validate the statement for run_id = 0, 1, ..., (n_runs - 1) on a pool of processes
+        the range of runs is cut into contiguous shards; the prime table is handed to the workers through shared
+        memory, and once a shard fails every shard starting past the failing run is cancelled
+        self must be picklable, i.e. its class has to be defined at module level
+        :param n_runs: number of runs
+        :param n_workers: int, number of processes, defaults to the number of CPUs
+        :param n_shards: int, number of shards, defaults to 4 shards per process
+        :return: ValidationReport with the first failing run (None if all runs pass) and per-shard timings
+        """
+        n_workers = n_workers or os.cpu_count() or 1
+        n_shards = max(1, min(n_shards or 4 * n_workers, n_runs))
+        bounds = [n_runs * i // n_shards for i in range(n_shards + 1)]
+
+        first_failure = Value("q", n_runs)
+        shm, shm_name = None, None
+        bound = self.prime_bound(n_runs)
+        if bound is not None and shared_primes.extend(bound):
+            bitmap = shared_primes.bitmap
+            shm = shared_memory.SharedMemory(create=True, size=max(bitmap.nbytes, 1))
+            np.ndarray(bitmap.shape, dtype=np.uint8, buffer=shm.buf)[:] = bitmap
+            shm_name = shm.name
+
+        shards = []
+        try:
+            with ProcessPoolExecutor(n_workers, initializer=_init_validation_worker,
+                                     initargs=(shm_name, shared_primes.n, first_failure)) as executor:
+                futures = {}
+                for start, stop in zip(bounds[:-1], bounds[1:]):
+                    step = max(1, (stop - start) // 16)
+                    futures[executor.submit(_validate_shard, self, start, stop, step)] = (start, stop)
+
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        start, stop = futures[future]
+                        shards.append(ShardTiming(start, stop, None, "cancelled", 0.))
+                        continue
+
+                    shard = future.result()
+                    shards.append(shard)
+                    if shard.failure is not None:
+                        for other, (start, _) in futures.items():
+                            if start > shard.failure:
+                                other.cancel()
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+        failure = None if first_failure.value == n_runs else first_failure.value
+        k = None if failure is None else self.__class__.map_run_id(failure)
+        return ValidationReport(n_runs, failure, k, sorted(shards))
+
+    def prime_bound(self, n_runs):
+        """
+        ceil of the prime table needed to check the runs below n_runs, to be shared with parallel workers
+        :param n_runs: number of runs
+        :return: int, or None if the statement does not use the shared prime table
+        """
+        return None
+
+    def first_failure(self, start, stop):
+        """
+        find the first run in [start, stop) for which the statement does not hold
+        subclasses may override this with a vectorized check of the whole range
+        :param start: int, first run_id to check
+        :param stop: int, run_id past the last one to check
+        :return: int, the failing run_id, or None if the statement holds for every run
+        """
+        for run in range(start, stop):
+            if not self.statement(self.__class__.map_run_id(run), verbose=False):
+                return run
+        return None
+
     @abstractmethod
     def statement(self, k, verbose=True) -> bool:
         """
@@ -75,19 +517,75 @@ class GoldbachValidator(Validator):
         """map run_id to the primary argument of the statement"""
         return run_id * 2 + 6
 
+    def __init__(self, block_size=1 << 16):
+        """
+        validator of the Goldbach conjecture
+        :param block_size: int, number of runs checked per vectorized pass in self.first_failure()
+        """
+        super().__init__()
+        self.block_size = block_size
+
+    def prime_bound(self, n_runs):
+        """ceil of the prime table needed to check the runs below n_runs"""
+        return int(self.__class__.map_run_id(max(n_runs - 1, 0))) + 1
+
+    @staticmethod
+    def minimal_partitions(ks):
+        """
+        find the smallest prime p such that k - p is also prime, for a whole block of numbers at once
+        every still-unresolved k is tested against the same p in one vectorized bitmap lookup, and the block
+        shrinks as numbers get resolved, which happens within a few hundred primes in practice; primes are read
+        lazily from the bitmap and the search stops as soon as every k is resolved
+        :param ks: array-like of ints
+        :return: np.ndarray of int64, the smallest such p for each k, or 0 where k has no such partition
+        """
+        ks = np.asarray(ks, dtype=np.int64)
+        partitions = np.zeros(ks.shape, dtype=np.int64)
+        if ks.size == 0:
+            return partitions
+
+        bound = int(ks.max()) + 1
+        table = shared_primes if shared_primes.extend(bound) else PrimeGenerator(bound)
+        pending = np.flatnonzero(ks >= 4)
+
+        # primes are decoded lazily from the bitmap, a small chunk at a time, so no prime array is materialized
+        for chunk in table.iter_prime_arrays(chunk_bytes=1 << 10, n=bound // 2 + 1):
+            for p in chunk.tolist():
+                pending = pending[ks[pending] >= 2 * p]  # beyond k / 2 there is no partition left to find
+                if pending.size == 0:
+                    return partitions
+                found = table.is_prime(ks[pending] - p)
+                partitions[pending[found]] = p
+                pending = pending[~found]
+
+        return partitions
+
+    def first_failure(self, start, stop):
+        """
+        find the first run in [start, stop) for which the statement does not hold, one block at a time
+        :param start: int, first run_id to check
+        :param stop: int, run_id past the last one to check
+        :return: int, the failing run_id, or None if the statement holds for every run
+        """
+        for block_start in range(start, stop, self.block_size):
+            runs = np.arange(block_start, min(block_start + self.block_size, stop), dtype=np.int64)
+            failures = np.flatnonzero(self.minimal_partitions(self.__class__.map_run_id(runs)) == 0)
+            if failures.size:
+                return int(runs[failures[0]])
+        return None
+
     def statement(self, k, verbose=True):
         """
         statement that an even number k can be written as p1 + p2 where p1 and p2 are prime numbers
         :param verbose: print the primes found
         :return: bool, value of the statement
         """
-        primes = PrimeGenerator(k + 1).primes
+        p = int(self.minimal_partitions([k])[0])
 
-        for p in primes:
-            if (k - p) in primes:
-                if verbose:
-                    print("{} = {} + {}".format(k, p, k - p), end="\t\t")
-                return True
+        if p:
+            if verbose:
+                print("{} = {} + {}".format(k, p, k - p), end="\t\t")
+            return True
 
         if verbose:
             print("{} cannot be written as the sum of two primes".format(k))
@@ -1,20 +1,43 @@
 import numpy as np
+import os
 from abc import ABC, abstractmethod
-from copy import deepcopy
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import count
+import heapq
+import threading
+
+
+# an estimated integral, its standard error (or error bound) and the number of evaluations of f it took
+IntegralEstimate = namedtuple("IntegralEstimate", ["value", "error", "n_evals"])
 
 
 class Interval:
+    __slots__ = ("lower", "upper")
+
     def __init__(self, a, b):
         """
-        An interval of the form [a, b)
+        An immutable interval of the form [a, b)
         endpoints a and b are automatically swapped if b <= a to ensure correctness
         :param a: either of the endpoints of the interval
         :param b: the other endpoint of the interval
         """
-        if a < b:
-            self.lower, self.upper = a, b
-        else:
-            self.upper, self.lower = b, a
+        lower, upper = (a, b) if a < b else (b, a)
+        object.__setattr__(self, "lower", lower)
+        object.__setattr__(self, "upper", upper)
+
+    def __setattr__(self, name, value):
+        """intervals are immutable, which lets them be shared instead of copied"""
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        """intervals are immutable, which lets them be shared instead of copied"""
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __reduce__(self):
+        """pickle and copy an interval by its endpoints"""
+        return Interval, (self.lower, self.upper)
 
     def __contains__(self, x):
         """
@@ -32,6 +55,12 @@ class Interval:
         """
         return (self.lower == other.lower) and (self.upper == other.upper)
 
+    def __hash__(self):
+        """
+        hash of the endpoints, consistent with __eq__
+        """
+        return hash((self.lower, self.upper))
+
     def __repr__(self):
         """
         internal string representation of the instance
@@ -63,12 +92,12 @@ class Interval:
         """
         parse the input into a standard `Interval` instance
         :param interval: tuple, list or Interval
-        :return: Interval
+        :return: Interval, `interval` itself if it is already one
         """
         if isinstance(interval, (list, tuple)):
             return Interval(*interval)
         elif isinstance(interval, Interval):
-            return deepcopy(interval)
+            return interval
         else:
             raise TypeError("interval unrecognized")
 
@@ -85,12 +114,147 @@ class Interval:
         if number in self:
             return Interval(self.lower, number), Interval(number, self.upper)
         elif number < self.lower:
-            return None, deepcopy(self)
+            return None, self
         else:
-            return deepcopy(self), None
+            return self, None
+
+
+class IntervalArray:
+    __slots__ = ("lowers", "uppers")
+
+    def __init__(self, a, b):
+        """
+        An immutable collection of intervals of the form [a, b), stored as two contiguous float64 arrays
+        endpoints are automatically swapped wherever b <= a, as in Interval
+        :param a: array-like of floats, either of the endpoints of each interval
+        :param b: array-like of floats, the other endpoint of each interval
+        """
+        a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+        self._set_bounds(np.minimum(a, b).ravel(), np.maximum(a, b).ravel())
+
+    def _set_bounds(self, lowers, uppers):
+        """store already ordered bounds as read-only arrays"""
+        lowers.setflags(write=False)
+        uppers.setflags(write=False)
+        object.__setattr__(self, "lowers", lowers)
+        object.__setattr__(self, "uppers", uppers)
+
+    @staticmethod
+    def _from_ordered(lowers, uppers):
+        """build an IntervalArray from bounds already known to satisfy lowers <= uppers, without checking them"""
+        intervals = object.__new__(IntervalArray)
+        intervals._set_bounds(np.ascontiguousarray(lowers, dtype=np.float64),
+                              np.ascontiguousarray(uppers, dtype=np.float64))
+        return intervals
+
+    def __setattr__(self, name, value):
+        """interval arrays are immutable, which lets them be shared instead of copied"""
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __reduce__(self):
+        """pickle and copy an interval array by its bounds"""
+        return IntervalArray, (np.array(self.lowers), np.array(self.uppers))
+
+    def __len__(self):
+        """
+        number of intervals
+        """
+        return self.lowers.shape[0]
+
+    def __getitem__(self, item):
+        """
+        fetch one interval as an Interval, or a selection of intervals (slice, index array or mask) as an IntervalArray
+        """
+        if isinstance(item, (int, np.integer)):
+            return Interval(float(self.lowers[item]), float(self.uppers[item]))
+        return IntervalArray._from_ordered(self.lowers[item], self.uppers[item])
+
+    def __iter__(self):
+        """
+        iterate over the intervals as Interval instances
+        """
+        return (Interval(lower, upper) for lower, upper in zip(self.lowers.tolist(), self.uppers.tolist()))
+
+    def __eq__(self, other):
+        """
+        determine elementwise whether the intervals are the same as those of an other interval array
+        :param other: IntervalArray or Interval
+        :return: np.ndarray of bool
+        """
+        return (self.lowers == other.lower if isinstance(other, Interval) else self.lowers == other.lowers) & \
+               (self.uppers == other.upper if isinstance(other, Interval) else self.uppers == other.uppers)
+
+    __hash__ = None
+
+    def __repr__(self):
+        """
+        internal string representation of the instance
+        """
+        return "<{}: size={}>".format(self.__class__.__name__, len(self))
+
+    @staticmethod
+    def parse(intervals, uppers=None):
+        """
+        parse the input into a standard `IntervalArray` instance
+        :param intervals: IntervalArray, a sequence of Intervals, tuples or lists, or array-like lower bounds
+        :param uppers: None, or array-like upper bounds if `intervals` holds the lower bounds
+        :return: IntervalArray, `intervals` itself if it is already one
+        """
+        if isinstance(intervals, IntervalArray):
+            return intervals
+        if uppers is not None:
+            return IntervalArray(intervals, uppers)
+
+        intervals = [Interval.parse(interval) for interval in intervals]
+        return IntervalArray([interval.lower for interval in intervals], [interval.upper for interval in intervals])
+
+    @property
+    def bounds(self):
+        """
+        fetches the lower bounds and upper bounds as a tuple of np.ndarrays
+        """
+        return self.lowers, self.uppers
+
+    @property
+    def measure(self):
+        """
+        fetches the lengths of the intervals as an np.ndarray
+        """
+        return self.uppers - self.lowers
+
+    def contains(self, x):
+        """
+        determine elementwise whether numbers lie within the intervals
+        :param x: float, or array-like broadcastable against the intervals (e.g. one number per interval)
+        :return: np.ndarray of bool
+        """
+        return (self.lowers <= x) & (x < self.uppers)
+
+    def discretize(self, num=10000):
+        """
+        discretize every interval into `num` equally spaced points, both endpoints included
+        :return: np.ndarray of shape (len(self), num)
+        """
+        return self.lowers[:, np.newaxis] + self.measure[:, np.newaxis] * np.linspace(0., 1., num=num)
+
+    def split_at(self, numbers):
+        """
+        split every interval into two sub-intervals at given numbers
+        unlike Interval.split_at(), an empty sub-interval is kept in place as a zero-measure interval rather than None
+        :param numbers: float, or array-like with one number per interval
+        :return: tuple of IntervalArrays (left parts, right parts)
+        """
+        cuts = np.clip(numbers, self.lowers, self.uppers)
+        return IntervalArray._from_ordered(self.lowers, cuts), IntervalArray._from_ordered(cuts, self.uppers)
 
 
 class BaseIntegrator(ABC):
+    # how compute_adaptive_integral() refines its estimate: "grow" pools ever larger independent estimates on the
+    # whole domain, "bisect" repeatedly splits the sub-interval with the largest error estimate
+    adaptive_strategy = "grow"
+    # number of samples or steps of the first estimate made by compute_adaptive_integral()
+    n_initial = 1000
+
     def __init__(self, f):
         """
         An integrator that computes integral of function f on any bounded interval
@@ -110,15 +274,180 @@ class BaseIntegrator(ABC):
         """
         raise NotImplementedError("method not implemented in {}".format(self.__class__))
 
+    def _estimate(self, domain, n):
+        """
+        estimate the integral of self.f on the given interval with a given budget, along with its error
+        :param domain: Interval, interval on which self.f is integrated
+        :param n: int, number of samples or steps
+        :return: IntegralEstimate
+        """
+        raise NotImplementedError("method not implemented in {}".format(self.__class__))
+
+    def compute_adaptive_integral(self, domain, tol, max_evals=10 ** 7):
+        """
+        compute the integral of self.f on the given interval, refining until the error estimate is within `tol`
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param tol: float, target (absolute) error
+        :param max_evals: int, budget of evaluations of self.f, after which the current estimate is returned
+        :return: IntegralEstimate, whose error is above `tol` only if the budget ran out
+        """
+        domain = Interval.parse(domain)
+        if self.adaptive_strategy == "bisect":
+            return self._bisect_integral(domain, tol, max_evals)
+        return self._grow_integral(domain, tol, max_evals)
+
+    def _grow_integral(self, domain, tol, max_evals):
+        """
+        pool independent estimates on the whole domain, doubling the total sample count each time
+        estimates are weighted by their number of samples, so this suits unbiased stochastic estimates
+        """
+        n, total_n, weighted_sum, weighted_variance, n_evals = self.n_initial, 0, 0., 0., 0
+        while True:
+            estimate = self._estimate(domain, n)
+            total_n += n
+            weighted_sum += n * estimate.value
+            weighted_variance += (n * estimate.error) ** 2
+            n_evals += estimate.n_evals
+
+            value, error = weighted_sum / total_n, np.sqrt(weighted_variance) / total_n
+            # the next estimate uses as many samples as all previous ones together, hence about as many evaluations
+            if error <= tol or 2 * n_evals > max_evals:
+                return IntegralEstimate(float(value), float(error), n_evals)
+            n = total_n
+
+    def _bisect_integral(self, domain, tol, max_evals):
+        """
+        keep a heap of sub-intervals keyed by error estimate and bisect the worst one until the total error is
+        within `tol`; this suits deterministic rules whose error shrinks quickly with the interval width
+        """
+        tie_breaker = count()
+        estimate = self._estimate(domain, self.n_initial)
+        n_evals = estimate.n_evals
+        heap = [(-estimate.error, next(tie_breaker), domain, estimate)]
+        final = []  # estimates of the intervals too narrow to be split in floating point
+        value, error = estimate.value, estimate.error
+
+        while heap and error > tol and n_evals + 2 * estimate.n_evals <= max_evals:
+            _, _, interval, worst = heapq.heappop(heap)
+            midpoint = (interval.lower + interval.upper) / 2
+            if not interval.lower < midpoint < interval.upper:
+                final.append(worst)
+                continue
+
+            value -= worst.value
+            error -= worst.error
+            for half in interval.split_at(midpoint):
+                estimate = self._estimate(half, self.n_initial)
+                heapq.heappush(heap, (-estimate.error, next(tie_breaker), half, estimate))
+                value += estimate.value
+                error += estimate.error
+                n_evals += estimate.n_evals
+
+        # recompute the sums from scratch to shed the rounding drift of the running updates
+        estimates = final + [e for *_, e in heap]
+        return IntegralEstimate(float(sum(e.value for e in estimates)), float(sum(e.error for e in estimates)), n_evals)
+
+
+class RangeCache:
+    def __init__(self, maxsize=256):
+        """
+        thread-safe LRU cache of function ranges, keyed by (function, lower, upper, probe settings)
+        functions are keyed by identity and held by strong references: only pass the cache to integrators of pure
+        functions, since a callable whose output changes between calls would be sampled against a stale range
+        :param maxsize: int, number of ranges kept before the least recently used one is evicted
+        """
+        self.maxsize = maxsize
+        self.hits, self.misses = 0, 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """number of cached ranges"""
+        return len(self._entries)
+
+    def __getstate__(self):
+        """pickle the settings only, so that integrators holding the cache can be sent to other processes"""
+        return {"maxsize": self.maxsize}
+
+    def __setstate__(self, state):
+        """restore an empty cache from pickled settings"""
+        self.__init__(state["maxsize"])
+
+    def get(self, key):
+        """
+        fetch a cached range and mark it as most recently used
+        :param key: hashable key
+        :return: the cached value, or None if absent
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """
+        cache a range, evicting the least recently used ones beyond self.maxsize
+        :param key: hashable key
+        :param value: the range to cache
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """drop every cached range"""
+        with self._lock:
+            self._entries.clear()
+
+
+# process-wide cache of function ranges, for Monte Carlo integrators of pure functions to opt into
+shared_range_cache = RangeCache()
+
 
 class MonteCarloIntegrator(BaseIntegrator):
-    def compute_integral(self, domain, n_tests=10000):
+    # number of evaluations of f used by default to bound its range on the domain
+    n_range_steps = 1000
+    # when refining a range, number of points per zoom around an extremum and number of zooms
+    n_refine_steps = 16
+    n_refine_rounds = 4
+
+    def __init__(self, f, chunk_size=1 << 16, seed=None, range_cache=None, refine_range=False):
+        """
+        An integrator that estimates integrals by hit-or-miss sampling, drawing samples in chunks
+        :param f: a callable that represents a mapping f: R -> R, evaluated on whole np.ndarrays of samples
+        :param chunk_size: int, number of samples drawn and evaluated at a time, which bounds the memory used
+        :param seed: None, int, np.random.SeedSequence or np.random.Generator, seeds the sampling
+        :param range_cache: RangeCache memoizing the range of f per domain, e.g. shared_range_cache if f is pure, or
+                            None to probe f on every call
+        :param refine_range: bool, whether to zoom in around the discrete extrema of f to bound its range precisely
+        """
+        super().__init__(f)
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng(seed)
+        self.range_cache = range_cache
+        self.refine_range = refine_range
+
+    def compute_integral(self, domain, n_tests=10000, n_workers=None, tol=None, max_evals=10 ** 7):
         """
         use Monte Carlo method to compute the integral of self.f  on the given interval
         :param domain: Interval, tuple, or list; interval on which self.f is integrated
         :param n_tests: int, number of tests to run respectively on positive and negative ranges
-        :return: float, the integral of self.f on `domain`
+        :param n_workers: int or None; if given, the tests are split over that many processes
+        :param tol: float or None; if given, n_tests is ignored and tests are added until the standard error is within
+        `tol`, see BaseIntegrator.compute_adaptive_integral()
+        :param max_evals: int, budget of evaluations of self.f when `tol` is given
+        :return: float, the integral of self.f on `domain`; IntegralEstimate if `tol` is given
         """
+        if tol is not None:
+            return self.compute_adaptive_integral(domain, tol, max_evals)
+        if n_workers is not None:
+            return self.estimate_integral(domain, n_tests, n_workers=n_workers).value
+
         domain = Interval.parse(domain)
         # trailing underscore in `range_` is meant to avoid shadowing the built-in `range` function
         range_ = self._get_range(domain)
@@ -134,18 +463,157 @@ class MonteCarloIntegrator(BaseIntegrator):
 
         return pos_integral - neg_integral
 
-    def _get_range(self, domain, n_steps=1000):
+    def estimate_integral(self, domain, n_tests=10000, n_workers=None):
+        """
+        use Monte Carlo method to estimate the integral of self.f on the given interval, along with its standard error
+        the tests are split evenly over `n_workers` processes, each drawing from its own stream spawned from one
+        np.random.SeedSequence, so the estimate is bit-for-bit reproducible for a given seed and number of workers
+        self.f must be picklable (e.g. a module-level function, not a lambda) when n_workers > 1
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param n_tests: int, number of tests to run respectively on positive and negative ranges
+        :param n_workers: int, number of processes, defaults to the number of CPUs; 1 runs in this process
+        :return: IntegralEstimate
+        """
+        domain = Interval.parse(domain)
+        range_, n_range_evals = self._bound_range(domain)
+        neg_range, pos_range = range_.split_at(0)
+        n_workers = max(1, min(n_workers or os.cpu_count() or 1, n_tests))
+
+        root = np.random.SeedSequence(self.rng.integers(np.iinfo(np.int64).max, size=4))
+        seeds = root.spawn(n_workers)
+        shares = [n_tests * (i + 1) // n_workers - n_tests * i // n_workers for i in range(n_workers)]
+        jobs = [(self, domain, (pos_range, neg_range), share, seed) for share, seed in zip(shares, seeds)]
+
+        if n_workers == 1:
+            partial_hits = [_count_hits_job(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(n_workers) as executor:
+                partial_hits = list(executor.map(_count_hits_job, *zip(*jobs)))
+
+        value, variance = 0., 0.
+        for sign, y_interval, hits in zip((1, -1), (pos_range, neg_range), zip(*partial_hits)):
+            if y_interval is None:
+                continue
+            # area of the box below (above) the sampled range, then the hit fraction of the sampled box
+            value += sign * min(abs(y_interval.lower), abs(y_interval.upper)) * domain.measure
+            area = domain.measure * y_interval.measure
+            p = sum(hits) / n_tests
+            value += sign * p * area
+            variance += area ** 2 * p * (1 - p) / n_tests
+
+        n_sampled = sum(y_interval is not None for y_interval in (pos_range, neg_range))  # f is evaluated per side
+        return IntegralEstimate(float(value), float(np.sqrt(variance)), n_sampled * n_tests + n_range_evals)
+
+    def compute_integrals(self, intervals, uppers=None, n_tests=10000):
+        """
+        use Monte Carlo method to compute the integral of self.f on many intervals at once
+        ranges are bounded on 2-D grids of about a million nodes at a time, and every chunk of samples is a 2-D matrix
+        (one row per interval) on which self.f is evaluated once; each x sample is tested against one y sample in the
+        positive range and one in the negative range, so self.f is evaluated n_tests times per interval instead of
+        2 * n_tests
+        the ranges are always probed on the plain grid of self.n_range_steps points: self.range_cache and
+        self.refine_range are ignored, so bounds may differ slightly from those used by compute_integral()
+        self.f must accept 2-D np.ndarrays
+        :param intervals: IntervalArray, a sequence of intervals, or array-like lower bounds of the intervals
+        :param uppers: None, or array-like upper bounds of the intervals if `intervals` holds the lower bounds
+        :param n_tests: int, number of tests to run per interval
+        :return: np.ndarray of floats, the integral of self.f on each interval
+        """
+        intervals = IntervalArray.parse(intervals, uppers)
+        lowers, widths = intervals.lowers, intervals.measure
+        column = (slice(None), np.newaxis)
+
+        range_lower, range_upper = np.empty(lowers.shape), np.empty(lowers.shape)
+        block = max(1, (1 << 20) // self.n_range_steps)  # bound the grid to about a million nodes at a time
+        for start in range(0, lowers.shape[0], block):
+            rows = slice(start, start + block)
+            discrete_range = self.f(intervals[rows].discretize(self.n_range_steps))
+            range_lower[rows], range_upper[rows] = np.min(discrete_range, axis=1), np.max(discrete_range, axis=1)
+        # split each range at 0, as compute_integral() does; an empty side has zero height
+        pos_lower, pos_upper = np.maximum(range_lower, 0.), np.maximum(range_upper, 0.)
+        neg_lower, neg_upper = np.minimum(range_lower, 0.), np.minimum(range_upper, 0.)
+
+        pos_hits, neg_hits = np.zeros(lowers.shape), np.zeros(lowers.shape)
+        chunk = max(1, self.chunk_size // max(1, lowers.shape[0]))
+        for offset in range(0, n_tests, chunk):
+            size = (lowers.shape[0], min(chunk, n_tests - offset))
+            fx = self.f(lowers[column] + widths[column] * self.rng.uniform(size=size))
+            below, above = np.minimum(fx, 0), np.maximum(fx, 0)
+            for hits, lower, upper in ((pos_hits, pos_lower, pos_upper), (neg_hits, neg_lower, neg_upper)):
+                y = lower[column] + (upper - lower)[column] * self.rng.uniform(size=size)
+                hits += np.count_nonzero((below <= y) & (y < above), axis=1)
+
+        pos_integrals = widths * (pos_lower + pos_hits / n_tests * (pos_upper - pos_lower))
+        neg_integrals = widths * (-neg_upper + neg_hits / n_tests * (neg_upper - neg_lower))
+        return pos_integrals - neg_integrals
+
+    def _estimate(self, domain, n):
+        """estimate the integral of self.f on the given interval with n tests per range, in this process"""
+        return self.estimate_integral(domain, n, n_workers=1)
+
+    def _get_range(self, domain, n_steps=None):
         """
         get the range of the self.f on `domain` on which self.f is assumed to be continuous
         :param domain: Interval, where the range is computed
-        :param n_steps: number of steps used for discretization
+        :param n_steps: number of steps used for discretization, defaults to self.n_range_steps
         :return: Interval, representing the range of self.f on `domain`
         """
+        return self._bound_range(domain, n_steps)[0]
+
+    def _bound_range(self, domain, n_steps=None):
+        """
+        get the range of self.f on `domain` through self.range_cache, probing self.f only on a cache miss
+        :param domain: Interval, where the range is computed
+        :param n_steps: number of steps used for discretization, defaults to self.n_range_steps
+        :return: tuple (Interval, number of evaluations of self.f spent)
+        """
+        n_steps = n_steps or self.n_range_steps
+        key = (self.f, domain.lower, domain.upper, n_steps, self.refine_range)
+        try:
+            cached = None if self.range_cache is None else self.range_cache.get(key)
+        except TypeError:  # unhashable function, cannot be memoized
+            key, cached = None, None
+        if cached is not None:
+            return cached, 0
+
         # discretize domain and range for computability
         discrete_domain = domain.discretize(n_steps)
         discrete_range = self.f(discrete_domain)
+        n_evals = n_steps
         # HACK: assuming continuity of self.f
-        return Interval(np.min(discrete_range), np.max(discrete_range))
+        lower, upper = np.min(discrete_range), np.max(discrete_range)
+
+        if self.refine_range:
+            lower, lower_evals = self._refine_extremum(discrete_domain, discrete_range, np.argmin(discrete_range), -1)
+            upper, upper_evals = self._refine_extremum(discrete_domain, discrete_range, np.argmax(discrete_range), 1)
+            n_evals += lower_evals + upper_evals
+
+        range_ = Interval(lower, upper)
+        if key is not None and self.range_cache is not None:
+            self.range_cache.put(key, range_)
+        return range_, n_evals
+
+    def _refine_extremum(self, discrete_domain, discrete_range, index, sign):
+        """
+        zoom in around a discrete extremum of self.f, re-discretizing the cells next to it self.n_refine_rounds times
+        :param discrete_domain: np.ndarray, points at which self.f was evaluated
+        :param discrete_range: np.ndarray, values of self.f at those points
+        :param index: int, index of the discrete extremum
+        :param sign: 1 to refine a maximum, -1 to refine a minimum
+        :return: tuple (refined extremum, number of evaluations of self.f spent)
+        """
+        best = discrete_range[index]
+        a = discrete_domain[max(index - 1, 0)]
+        b = discrete_domain[min(index + 1, discrete_domain.shape[0] - 1)]
+
+        for _ in range(self.n_refine_rounds):
+            points = np.linspace(a, b, self.n_refine_steps)
+            values = self.f(points)
+            i = np.argmax(sign * values)
+            best = values[i] if sign * values[i] > sign * best else best
+            a, b = points[max(i - 1, 0)], points[min(i + 1, points.shape[0] - 1)]
+
+        return best, self.n_refine_rounds * self.n_refine_steps
 
     def _monte_carlo_test(self, x_interval, y_interval, n_tests=10000):
         """
@@ -159,21 +627,308 @@ class MonteCarloIntegrator(BaseIntegrator):
         if x_interval is None or y_interval is None:
             return 0.
 
+        hits = self._count_hits(x_interval, y_interval, n_tests, self.rng)
+        return hits / n_tests * x_interval.measure * y_interval.measure
+
+    def _count_hits(self, x_interval, y_interval, n_tests, rng):
+        """
+        count the samples drawn uniformly from x_interval * y_interval that fall between 0 and the graph of self.f
+        samples are drawn and tested self.chunk_size at a time
+        :param x_interval: Interval
+        :param y_interval: Interval
+        :param n_tests: number of tests to run
+        :param rng: np.random.Generator to draw the samples from
+        :return: int, number of hits
+        """
         hits = 0
-        for test in range(n_tests):
-            x = np.random.uniform(*x_interval.bounds)
-            y = np.random.uniform(*y_interval.bounds)
-            if y in Interval(0, self.f(x)):
-                hits += 1
+        for offset in range(0, n_tests, self.chunk_size):
+            size = min(self.chunk_size, n_tests - offset)
+            x = rng.uniform(*x_interval.bounds, size=size)
+            y = rng.uniform(*y_interval.bounds, size=size)
+            fx = self.f(x)
+            # same test as `y in Interval(0, f(x))`, i.e. y in [min(0, f(x)), max(0, f(x)))
+            hits += int(np.count_nonzero((np.minimum(fx, 0) <= y) & (y < np.maximum(fx, 0))))
 
-        return hits / n_tests * x_interval.measure * y_interval.measure
+        return hits
 
 
-class RiemannIntegrator(BaseIntegrator):
-    def compute_integral(self, domain, n_steps=10000):
-        discrete_domain = domain.discretize(n_steps)
-        discrete_range = self.f(discrete_domain)
-        return np.sum(discrete_range) * domain.measure / n_steps
+def _count_hits_job(integrator, x_interval, y_intervals, n_tests, seed):
+    """
+    count the hits of `n_tests` samples on each of `y_intervals`, drawing from a generator seeded with `seed`
+    defined at module level so that it can be sent to the workers of a process pool
+    :return: tuple of ints, number of hits on each y_interval (0 for empty ones)
+    """
+    rng = np.random.default_rng(seed)
+    return tuple(0 if y_interval is None else integrator._count_hits(x_interval, y_interval, n_tests, rng)
+                 for y_interval in y_intervals)
+
+
+class QuadratureIntegrator(BaseIntegrator):
+    adaptive_strategy = "bisect"
+    # size of the rule used by compute_integrals() and integrate_functions() when none is given
+    default_rule_size = 1000
+
+    @abstractmethod
+    def _reference_rule(self, n):
+        """
+        nodes and weights of the rule on the reference interval [0, 1]
+        :param n: int, size of the rule, as understood by the subclass
+        :return: tuple of np.ndarrays (nodes, weights)
+        """
+        raise NotImplementedError("method not implemented in {}".format(self.__class__))
+
+    def _integrate(self, domain, n):
+        """
+        apply the rule of size n to self.f on the given interval, evaluating self.f once on all nodes
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param n: int, size of the rule
+        :return: float, the integral of self.f on `domain`
+        """
+        domain = Interval.parse(domain)
+        nodes, weights = self._reference_rule(n)
+        return float(domain.measure * np.dot(weights, self.f(domain.lower + domain.measure * nodes)))
+
+    def compute_integrals(self, intervals, uppers=None, n=None):
+        """
+        compute the integral of self.f on many intervals at once
+        the rule is built once and self.f is evaluated on a single 2-D grid of nodes (one row per interval),
+        so self.f must accept 2-D np.ndarrays
+        :param intervals: IntervalArray, a sequence of intervals, or array-like lower bounds of the intervals
+        :param uppers: None, or array-like upper bounds of the intervals if `intervals` holds the lower bounds
+        :param n: size of the rule, defaults to self.default_rule_size
+        :return: np.ndarray of floats, the integral of self.f on each interval
+        """
+        intervals = IntervalArray.parse(intervals, uppers)
+        lowers, widths = intervals.lowers, intervals.measure
+        nodes, weights = self._reference_rule(self.default_rule_size if n is None else n)
+
+        integrals = np.empty(lowers.shape)
+        block = max(1, (1 << 20) // nodes.shape[0])  # bound the grid to about a million nodes at a time
+        for start in range(0, lowers.shape[0], block):
+            rows = slice(start, start + block)
+            grid = lowers[rows, np.newaxis] + widths[rows, np.newaxis] * nodes
+            integrals[rows] = widths[rows] * (self.f(grid) @ weights)
+        return integrals
+
+    @classmethod
+    def integrate_functions(cls, functions, domain, n=None, **kwargs):
+        """
+        compute the integrals of many functions on the same interval, evaluating all of them on one set of nodes
+        :param functions: list of callables, each representing a mapping f: R -> R
+        :param domain: Interval, tuple, or list; interval on which the functions are integrated
+        :param n: size of the rule, defaults to cls.default_rule_size
+        :param kwargs: keyword arguments passed on to the constructor of cls
+        :return: np.ndarray of floats, the integral of each function on `domain`
+        """
+        if not functions:
+            return np.zeros(0)
+
+        domain = Interval.parse(domain)
+        nodes, weights = cls(functions[0], **kwargs)._reference_rule(cls.default_rule_size if n is None else n)
+        x = domain.lower + domain.measure * nodes
+        return domain.measure * np.array([np.dot(weights, f(x)) for f in functions])
+
+
+class RiemannIntegrator(QuadratureIntegrator):
+    n_initial = 64
+    default_rule_size = 10000
+
+    def compute_integral(self, domain, n_steps=10000, tol=None, max_evals=10 ** 7):
+        """
+        compute a Riemann sum of self.f on the given interval
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param n_steps: int, number of steps of the sum
+        :param tol: float or None; if given, n_steps is ignored and the interval is bisected adaptively until the
+        error estimate is within `tol`, see BaseIntegrator.compute_adaptive_integral()
+        :param max_evals: int, budget of evaluations of self.f when `tol` is given
+        :return: float, the integral of self.f on `domain`; IntegralEstimate if `tol` is given
+        """
+        if tol is not None:
+            return self.compute_adaptive_integral(domain, tol, max_evals)
+        return self._integrate(domain, n_steps)
+
+    def _reference_rule(self, n):
+        """n equally spaced nodes on [0, 1], both ends included, each weighted by 1 / n"""
+        return np.linspace(0., 1., num=n, endpoint=True), np.full(n, 1. / n)
+
+    def _estimate(self, domain, n):
+        """estimate the integral with n steps, taking the gap to the sum with n / 2 steps as the error"""
+        fine = self.compute_integral(domain, n_steps=n)
+        coarse = self.compute_integral(domain, n_steps=n // 2)
+        return IntegralEstimate(float(fine), float(abs(fine - coarse)), n + n // 2)
+
+
+class SimpsonIntegrator(QuadratureIntegrator):
+    n_initial = 16
+
+    def compute_integral(self, domain, n_steps=1000, tol=None, max_evals=10 ** 7):
+        """
+        compute the integral of self.f on the given interval with the composite Simpson rule, whose error is O(n^-4)
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param n_steps: int, number of steps, rounded up to an even number
+        :param tol: float or None; if given, n_steps is ignored and the interval is bisected adaptively until the
+        error estimate is within `tol`, see BaseIntegrator.compute_adaptive_integral()
+        :param max_evals: int, budget of evaluations of self.f when `tol` is given
+        :return: float, the integral of self.f on `domain`; IntegralEstimate if `tol` is given
+        """
+        if tol is not None:
+            return self.compute_adaptive_integral(domain, tol, max_evals)
+        return self._integrate(domain, n_steps)
+
+    def _reference_rule(self, n):
+        """composite Simpson rule with n steps (rounded up to an even number) on [0, 1]"""
+        n = max(2, n + n % 2)
+        weights = np.full(n + 1, 2.)
+        weights[1::2] = 4.
+        weights[[0, -1]] = 1.
+        return np.linspace(0., 1., n + 1), weights / (3 * n)
+
+    def _estimate(self, domain, n):
+        """
+        estimate the integral with n steps; the rule with n / 2 steps reuses every other node, and the gap between
+        the two, divided by 15 as in Richardson extrapolation, is taken as the error
+        """
+        n = max(4, n + (-n) % 4)
+        nodes, weights = self._reference_rule(n)
+        values = self.f(domain.lower + domain.measure * nodes)
+        fine = domain.measure * np.dot(weights, values)
+        coarse = domain.measure * np.dot(self._reference_rule(n // 2)[1], values[::2])
+        return IntegralEstimate(float(fine), float(abs(fine - coarse) / 15), n + 1)
+
+
+@lru_cache(maxsize=64)
+def _gauss_legendre_rule(n):
+    """nodes and weights of the n-point Gauss-Legendre rule on [0, 1], computed once per n"""
+    nodes, weights = np.polynomial.legendre.leggauss(n)
+    nodes, weights = (nodes + 1) / 2, weights / 2
+    nodes.setflags(write=False)
+    weights.setflags(write=False)
+    return nodes, weights
+
+
+class GaussLegendreIntegrator(QuadratureIntegrator):
+    n_initial = 10
+    default_rule_size = 32
+
+    def compute_integral(self, domain, n_nodes=32, n_panels=1, tol=None, max_evals=10 ** 7):
+        """
+        compute the integral of self.f on the given interval with a (composite) Gauss-Legendre rule
+        an n-point rule is exact for polynomials of degree up to 2n - 1, and converges exponentially for smooth f
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param n_nodes: int, number of nodes per panel
+        :param n_panels: int, number of equal panels the interval is cut into
+        :param tol: float or None; if given, n_nodes and n_panels are ignored and the interval is bisected adaptively
+        until the error estimate is within `tol`, see BaseIntegrator.compute_adaptive_integral()
+        :param max_evals: int, budget of evaluations of self.f when `tol` is given
+        :return: float, the integral of self.f on `domain`; IntegralEstimate if `tol` is given
+        """
+        if tol is not None:
+            return self.compute_adaptive_integral(domain, tol, max_evals)
+        return self._integrate(domain, (n_nodes, n_panels))
+
+    def _reference_rule(self, n):
+        """
+        composite Gauss-Legendre rule on [0, 1]
+        :param n: int, number of nodes of a single panel, or tuple (number of nodes per panel, number of panels)
+        """
+        n_nodes, n_panels = n if isinstance(n, tuple) else (n, 1)
+        nodes, weights = _gauss_legendre_rule(n_nodes)
+        if n_panels == 1:
+            return nodes, weights
+
+        offsets = np.arange(n_panels)[:, np.newaxis]
+        return ((offsets + nodes) / n_panels).ravel(), np.tile(weights / n_panels, n_panels)
+
+    def _estimate(self, domain, n):
+        """estimate the integral with n nodes, taking the gap to the rule with n / 2 nodes as the error"""
+        fine = self._integrate(domain, n)
+        coarse = self._integrate(domain, n // 2)
+        return IntegralEstimate(fine, abs(fine - coarse), n + n // 2)
+
+
+def _radical_inverse(indices, base):
+    """
+    van der Corput radical inverse: mirror the base-`base` digits of each index around the radix point
+    :param indices: array-like of non-negative ints
+    :param base: int, base of the digit expansion
+    :return: np.ndarray of floats in [0, 1)
+    """
+    indices = np.array(indices, dtype=np.int64)
+    points = np.zeros(indices.shape)
+    scale = 1. / base
+    while np.any(indices):
+        indices, digits = np.divmod(indices, base)
+        points += digits * scale
+        scale /= base
+    return points
+
+
+class QuasiMonteCarloIntegrator(QuadratureIntegrator):
+    adaptive_strategy = "grow"
+    n_initial = 1024
+    default_rule_size = 4096
+
+    def __init__(self, f, sequence="sobol", base=2, n_shifts=8, seed=None):
+        """
+        An integrator that averages f over a low-discrepancy sequence, with an error of O(log(n) / n) for smooth f
+        in one dimension, Sobol points are the base-2 van der Corput points in Gray-code order; Halton points are the
+        van der Corput points in base `base`
+        :param f: a callable that represents a mapping f: R -> R, evaluated on whole np.ndarrays of points
+        :param sequence: "sobol" or "halton"
+        :param base: int, base of the Halton sequence
+        :param n_shifts: int, number of random shifts of the sequence used to estimate the error
+        :param seed: None, int, np.random.SeedSequence or np.random.Generator, seeds the random shifts
+        """
+        super().__init__(f)
+        if sequence not in ("sobol", "halton"):
+            raise ValueError("unknown sequence {}, expected 'sobol' or 'halton'".format(sequence))
+
+        self.sequence = sequence
+        self.base = base
+        self.n_shifts = n_shifts
+        self.rng = np.random.default_rng(seed)
+
+    def compute_integral(self, domain, n_points=4096, tol=None, max_evals=10 ** 7):
+        """
+        compute the integral of self.f on the given interval as its average over the first n_points of the sequence
+        :param domain: Interval, tuple, or list; interval on which self.f is integrated
+        :param n_points: int, number of points of the sequence
+        :param tol: float or None; if given, n_points is ignored and randomly shifted copies of the sequence are added
+        until the standard error is within `tol`, see BaseIntegrator.compute_adaptive_integral()
+        :param max_evals: int, budget of evaluations of self.f when `tol` is given
+        :return: float, the integral of self.f on `domain`; IntegralEstimate if `tol` is given
+        """
+        if tol is not None:
+            return self.compute_adaptive_integral(domain, tol, max_evals)
+        return self._integrate(domain, n_points)
+
+    def _points(self, n):
+        """first n points of the sequence"""
+        indices = np.arange(n, dtype=np.int64)
+        if self.sequence == "sobol":
+            return _radical_inverse(indices ^ (indices >> 1), 2)
+        return _radical_inverse(indices, self.base)
+
+    def _reference_rule(self, n):
+        """
+        first n points of the sequence on [0, 1], equally weighted
+        the points are shifted by half a step (modulo 1) so that, for n a power of the base, they are the midpoints
+        of n equal cells rather than their left ends
+        """
+        return (self._points(n) + 0.5 / n) % 1., np.full(n, 1. / n)
+
+    def _estimate(self, domain, n):
+        """
+        estimate the integral with n points split over self.n_shifts randomly shifted (modulo 1) copies of the
+        sequence; the spread of the per-shift averages gives the standard error
+        """
+        n_points = max(1, n // self.n_shifts)
+        shifts = self.rng.uniform(size=(self.n_shifts, 1))
+        nodes = (self._points(n_points) + shifts) % 1.
+        values = self.f(domain.lower + domain.measure * nodes.ravel()).reshape(nodes.shape)
+        averages = domain.measure * np.mean(values, axis=1)
+        error = np.std(averages, ddof=1) / np.sqrt(self.n_shifts) if self.n_shifts > 1 else np.inf
+        return IntegralEstimate(float(np.mean(averages)), float(error), nodes.size)
 
 
 if __name__ == '__main__':
@@ -187,3 +942,21 @@ if __name__ == '__main__':
     integrator2 = RiemannIntegrator(f)
     integral2 = integrator2.compute_integral(interval, n_steps=10000)
     print("Computing Riemann Sum: Integral on {} = {}".format(interval.bounds, integral2))
+
+    integrator3 = SimpsonIntegrator(f)
+    integral3 = integrator3.compute_integral(interval, n_steps=100)
+    print("Using composite Simpson rule: Integral on {} = {}".format(interval.bounds, integral3))
+
+    integrator4 = GaussLegendreIntegrator(f)
+    integral4 = integrator4.compute_integral(interval, n_nodes=10)
+    print("Using Gauss-Legendre quadrature: Integral on {} = {}".format(interval.bounds, integral4))
+
+    integrator5 = QuasiMonteCarloIntegrator(f, sequence="sobol")
+    integral5 = integrator5.compute_integral(interval, n_points=4096)
+    print("Using quasi-Monte Carlo method: Integral on {} = {}".format(interval.bounds, integral5))
+
+    # bisection must stop at intervals too narrow to split instead of failing on them
+    step = SimpsonIntegrator(lambda x: (x > np.sqrt(2)).astype(float)).compute_integral((0, 3), tol=1e-20,
+                                                                                       max_evals=10 ** 6)
+    assert abs(step.value - (3 - np.sqrt(2))) < 1e-9, step
+    print("Adaptive Simpson rule on a step function: Integral on (0, 3) = {}".format(step.value))
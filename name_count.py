@@ -1,8 +1,20 @@
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import argparse
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import sys
+import time
 import jieba
+import numpy as np
 
 
 class Name:
+    __slots__ = ("alias", "surname", "given_name")
+
     compound_surnames = ["诸葛", "司马", "公孙", "上官", "欧阳"]
 
     def __init__(self, full_name, alias=None):
@@ -11,9 +23,9 @@ class Name:
 
     @staticmethod
     def split_name(name):
-        for compound in Name.compound_surnames:
-            if name.find(compound) == 0:
-                return compound, name[len(compound):]
+        for length in _compound_surname_lengths:
+            if name[:length] in _compound_surname_set:
+                return name[:length], name[length:]
 
         return name[0], name[1:]
 
@@ -22,7 +34,7 @@ class Name:
         return self.surname + self.given_name
 
     def match(self, other):
-        return other in [self.fullname, self.given_name, self.alias]
+        return other == self.fullname or other == self.given_name or other == self.alias
 
     def __repr__(self):
         return "<{}:, surname={}, given-name={}, alias={}>".format(self.fullname, self.surname, self.given_name,
@@ -35,6 +47,11 @@ class Name:
         return counter.get(self.fullname, 0) + counter.get(self.alias, 0) + counter.get(self.given_name, 0)
 
 
+# lookup structures for Name.split_name(), longest compound surnames first
+_compound_surname_set = frozenset(Name.compound_surnames)
+_compound_surname_lengths = sorted({len(compound) for compound in Name.compound_surnames}, reverse=True)
+
+
 def parse_name_entry(s: str):
     left_pos = s.find("(")
     right_pos = s.find(")")
@@ -51,19 +68,531 @@ def parse_name_entry(s: str):
     return Name(full_name, alias)
 
 
-if __name__ == '__main__':
-    with open("corpus.txt") as f:
-        corpus = f.read()
+def load_names(path="name-list.txt"):
+    """
+    parse a name list, one entry per line, skipping blank lines
+    :param path: str, path to the name list
+    :return: list of Names
+    """
+    with open(path) as f:
+        return [parse_name_entry(line.strip()) for line in f if line.split()]
+
+
+# characters after which a line may be cut when it is too long to make up a single chunk
+SENTENCE_ENDS = "。！？；!?;"
+
+
+def _split_line(line, chunk_size):
+    """
+    cut a line longer than `chunk_size` into pieces ending on sentence boundaries
+    jieba never segments across these characters, so tokenizing the pieces yields the same tokens as the whole line
+    """
+    while len(line) > chunk_size:
+        cut = max(line.rfind(end, 0, chunk_size) for end in SENTENCE_ENDS)
+        if cut < 0:  # no boundary before chunk_size, take the first one after it
+            cut = min((pos for pos in (line.find(end, chunk_size) for end in SENTENCE_ENDS) if pos >= 0), default=-1)
+        if cut < 0 or cut == len(line) - 1:
+            break
+        yield line[:cut + 1]
+        line = line[cut + 1:]
+    yield line
+
+
+def iter_chunks(f, chunk_size=1 << 20):
+    """
+    read a text file in chunks of whole lines (i.e. whole paragraphs) of about `chunk_size` characters
+    a line longer than `chunk_size` is cut on sentence boundaries
+    :param f: text file object
+    :param chunk_size: int, number of characters after which a chunk is cut at the next line break
+    :return: generator of str
+    """
+    lines, size = [], 0
+    for line in f:
+        for piece in _split_line(line, chunk_size):
+            lines.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield "".join(lines)
+                lines, size = [], 0
+
+    if lines:
+        yield "".join(lines)
+
+
+def corpus_files(path):
+    """
+    list the files making up a corpus
+    :param path: str, path to a corpus file or to a directory of corpus files; or a list of such paths
+    :return: list of str, file paths in a deterministic order
+    """
+    if isinstance(path, (list, tuple)):
+        return [file for p in path for file in corpus_files(p)]
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if os.path.isfile(os.path.join(path, name)))
+    return [path]
+
+
+def iter_corpus_chunks(path, chunk_size=1 << 20):
+    """
+    read every file of a corpus in chunks, see iter_chunks()
+    :param path: str, path to a corpus file or to a directory of corpus files; or a list of such paths
+    :param chunk_size: int, approximate number of characters per chunk
+    :return: generator of str
+    """
+    for file in corpus_files(path):
+        with open(file) as f:
+            yield from iter_chunks(f, chunk_size)
+
+
+def count_tokens(path="corpus.txt", chunk_size=1 << 20, callback=None):
+    """
+    tokenize a corpus with jieba and count the tokens, streaming it chunk by chunk
+    tokens are fed from the jieba.cut generator straight into the counter, so the peak memory depends on the chunk
+    size and the vocabulary, not on the size of the corpus
+    :param path: str, path to a corpus file or to a directory of corpus files; or a list of such paths
+    :param chunk_size: int, approximate number of characters tokenized at a time
+    :param callback: callable or None, called after each chunk as callback(n_chars, n_tokens, seconds) with the
+    numbers of characters and tokens processed so far and the time elapsed
+    :return: Counter of tokens
+    """
+    counter = Counter()
+    n_chars, n_tokens, start = 0, 0, time.perf_counter()
+
+    for chunk in iter_corpus_chunks(path, chunk_size):
+        for token in jieba.cut(chunk):
+            counter[token] += 1
+            n_tokens += 1
+        n_chars += len(chunk)
+        if callback is not None:
+            callback(n_chars, n_tokens, time.perf_counter() - start)
+
+    return counter
+
+
+def _count_chunk(chunk):
+    """tokenize and count one chunk in a worker process, returning (number of characters, Counter of tokens)"""
+    return len(chunk), Counter(jieba.cut(chunk))
+
+
+def count_tokens_parallel(path="corpus.txt", n_workers=None, chunk_size=1 << 20, callback=None):
+    """
+    tokenize a corpus with jieba and count the tokens on a pool of processes
+    chunks are the same as those of count_tokens(), so the counts are exactly the same; jieba is initialized once per
+    worker, and at most two chunks per worker are in flight, which keeps the memory bounded
+    :param path: str, path to a corpus file or to a directory of corpus files; or a list of such paths
+    :param n_workers: int, number of processes, defaults to the number of CPUs
+    :param chunk_size: int, approximate number of characters per chunk
+    :param callback: callable or None, called as in count_tokens() after each chunk is merged
+    :return: Counter of tokens
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    counter = Counter()
+    n_chars, start = 0, time.perf_counter()
+
+    with ProcessPoolExecutor(n_workers, initializer=jieba.initialize) as executor:
+        pending = set()
+        chunks = iter_corpus_chunks(path, chunk_size)
+        while True:
+            for chunk in chunks:
+                pending.add(executor.submit(_count_chunk, chunk))
+                if len(pending) >= 2 * n_workers:
+                    break
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_chars, chunk_counter = future.result()
+                counter.update(chunk_counter)
+                n_chars += chunk_chars
+                if callback is not None:
+                    callback(n_chars, sum(counter.values()), time.perf_counter() - start)
+
+    return counter
+
+
+class NameIndex:
+    def __init__(self, names, ambiguous="all", min_length=1, compound_surnames=False):
+        """
+        index of every surface form of a list of names, built once
+        the forms of a name are its full name, alias and given name (each counted once, even if two coincide), plus
+        its surname when `compound_surnames` is set and the surname is one of Name.compound_surnames
+        :param names: list of Names
+        :param ambiguous: how to credit a form shared by several names (e.g. a common given name): "all" credits each
+        of them in full, as Name.total_occurrence() does, "split" divides the count evenly, "ignore" credits none
+        :param min_length: int, minimal length of an indexed form
+        :param compound_surnames: bool, whether to index compound surnames as forms
+        """
+        if ambiguous not in ("all", "split", "ignore"):
+            raise ValueError("unknown ambiguity policy {}, expected 'all', 'split' or 'ignore'".format(ambiguous))
+
+        self.names = list(names)
+        self.ambiguous = ambiguous
+        self.owners = {}  # form -> ids of the names it belongs to
+        for name_id, name in enumerate(self.names):
+            forms = [name.fullname, name.alias, name.given_name]
+            if compound_surnames and name.surname in _compound_surname_set:
+                forms.append(name.surname)
+            for form in dict.fromkeys(forms):
+                if form and len(form) >= min_length:
+                    self.owners.setdefault(form, []).append(name_id)
+
+        self.forms = list(self.owners)
+        self.form_ids = {form: form_id for form_id, form in enumerate(self.forms)}
+
+        # one (form, name, weight) triple per credit, so that counts aggregate in a single np.bincount
+        pair_forms, pair_names, pair_weights = [], [], []
+        for form_id, form in enumerate(self.forms):
+            owners = self.owners[form]
+            if len(owners) > 1 and ambiguous == "ignore":
+                continue
+            weight = 1. / len(owners) if ambiguous == "split" else 1.
+            for name_id in owners:
+                pair_forms.append(form_id)
+                pair_names.append(name_id)
+                pair_weights.append(weight)
+
+        self._pair_forms = np.array(pair_forms, dtype=np.int64)
+        self._pair_names = np.array(pair_names, dtype=np.int64)
+        self._pair_weights = np.array(pair_weights, dtype=np.float64)
+
+    def __len__(self):
+        """number of indexed forms"""
+        return len(self.forms)
+
+    def lookup(self, form):
+        """
+        fetch the names a surface form belongs to
+        :param form: str
+        :return: list of Names, empty if the form is unknown
+        """
+        return [self.names[name_id] for name_id in self.owners.get(form, [])]
+
+    def canonical(self, form):
+        """
+        fetch the single name a surface form belongs to
+        :param form: str
+        :return: Name, or None if the form is unknown or ambiguous
+        """
+        owners = self.owners.get(form, [])
+        return self.names[owners[0]] if len(owners) == 1 else None
+
+    def counts(self, counter):
+        """
+        aggregate the counts of the forms of every name, with one lookup per form in the counter
+        :param counter: dict-like, form (or token) -> count
+        :return: np.ndarray, count of each name in the order of self.names; integral unless ambiguous == "split"
+        """
+        form_counts = np.fromiter((counter.get(form, 0) for form in self.forms), dtype=np.float64,
+                                  count=len(self.forms))
+        totals = np.bincount(self._pair_names, weights=form_counts[self._pair_forms] * self._pair_weights,
+                             minlength=len(self.names))
+        return totals if self.ambiguous == "split" else np.rint(totals).astype(np.int64)
+
+    def name_counts(self, counter):
+        """
+        aggregate the counts of the forms of every name
+        :param counter: dict-like, form (or token) -> count
+        :return: dict, Name -> count
+        """
+        return dict(zip(self.names, self.counts(counter).tolist()))
+
+
+class NameMatcher:
+    def __init__(self, names, min_length=2, overlap="longest", ambiguous="all"):
+        """
+        tokenizer-free name counter: an Aho-Corasick automaton over every surface form of a list of names
+        the forms of a name are its full name, alias and given name, plus its surname when that is one of
+        Name.compound_surnames; forms shorter than `min_length` are left out, since single characters mostly occur
+        inside unrelated words
+        :param names: list of Names
+        :param min_length: int, minimal length of a form
+        :param overlap: "longest" to count leftmost-longest, non-overlapping matches (so a given name inside a full name
+        is not counted again), or "all" to count every occurrence of every form, overlapping or not
+        :param ambiguous: how to credit a form shared by several names, see NameIndex
+        """
+        if overlap not in ("longest", "all"):
+            raise ValueError("unknown overlap policy {}, expected 'longest' or 'all'".format(overlap))
 
-    with open("name-list.txt") as f:
-        names = [parse_name_entry(line) for line in f.readlines() if line.split()]
+        self.names = names
+        self.overlap = overlap
+        self.index = NameIndex(names, ambiguous=ambiguous, min_length=min_length, compound_surnames=True)
+        self.forms = self.index.forms
+        self._build()
 
-    tokens = list(jieba.lcut(corpus))
-    token_counter = Counter(tokens)
-    name_counter = {name: name.total_occurrence(token_counter) for name in names}
+    def _build(self):
+        """build the trie of self.forms, then its failure and dictionary links breadth-first"""
+        self._goto, self._output = [{}], [-1]
+        for form_id, form in enumerate(self.forms):
+            state = 0
+            for char in form:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._output.append(-1)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state] = form_id
 
-    ordered_name_counter = sorted(name_counter.items(), key=lambda p: p[-1], reverse=True)
+        # fail: longest proper suffix that is a trie state; dict_link: longest such suffix that ends a form
+        self._fail = [0] * len(self._goto)
+        self._dict_link = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                suffix = self._fail[child]
+                self._dict_link[child] = suffix if self._output[suffix] >= 0 else self._dict_link[suffix]
+                queue.append(child)
+
+    def iter_matches(self, text):
+        """
+        find every occurrence of every form in a single pass over the text, overlapping ones included
+        :param text: str
+        :return: generator of (start, form_id), in increasing order of end position
+        """
+        goto, fail, output, dict_link, forms = self._goto, self._fail, self._output, self._dict_link, self.forms
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            match = state if output[state] >= 0 else dict_link[state]
+            while match:
+                form_id = output[match]
+                yield end - len(forms[form_id]), form_id
+                match = dict_link[match]
+
+    def count(self, text):
+        """
+        count the occurrences of every form in a text, according to self.overlap
+        :param text: str
+        :return: Counter of forms
+        """
+        counter = Counter()
+        if self.overlap == "all":
+            for _, form_id in self.iter_matches(text):
+                counter[self.forms[form_id]] += 1
+            return counter
+
+        last_end = 0
+        matches = sorted(self.iter_matches(text), key=lambda m: (m[0], -len(self.forms[m[1]])))
+        for start, form_id in matches:
+            if start >= last_end:
+                counter[self.forms[form_id]] += 1
+                last_end = start + len(self.forms[form_id])
+        return counter
+
+    def count_corpus(self, path="corpus.txt", chunk_size=1 << 20, callback=None):
+        """
+        count the occurrences of every form in a corpus, streaming it chunk by chunk
+        chunks end on line or sentence boundaries, which no name spans
+        :param path: str, path to a corpus file or to a directory of corpus files; or a list of such paths
+        :param chunk_size: int, approximate number of characters scanned at a time
+        :param callback: callable or None, called as in count_tokens(), with matches in place of tokens
+        :return: Counter of forms
+        """
+        counter = Counter()
+        n_chars, start = 0, time.perf_counter()
+        for chunk in iter_corpus_chunks(path, chunk_size):
+            counter.update(self.count(chunk))
+            n_chars += len(chunk)
+            if callback is not None:
+                callback(n_chars, sum(counter.values()), time.perf_counter() - start)
+        return counter
+
+    def name_counts(self, form_counter):
+        """
+        add up the counts of the forms of each name, see NameIndex.name_counts()
+        :param form_counter: Counter of forms, e.g. from self.count_corpus()
+        :return: dict, Name -> count
+        """
+        return self.index.name_counts(form_counter)
+
+
+def top_names(name_counter, k=30):
+    """
+    fetch the k most frequent names with a heap, without sorting every name
+    :param name_counter: dict, Name -> count
+    :param k: int, number of names to return
+    :return: list of (Name, count), most frequent first
+    """
+    return heapq.nlargest(k, name_counter.items(), key=lambda p: p[-1])
+
+
+def _universal_newlines(text):
+    """translate \r\n and \r line endings to \n, as reading a file in text mode does"""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+class TokenStore:
+    manifest_file = "manifest.json"
+    counts_file = "counts.json.gz"
+
+    def __init__(self, directory=".name_count"):
+        """
+        persisted token counts of a corpus that only re-tokenizes what changed since the last update
+        the store keeps one token counter per corpus file (a gzipped JSON snapshot) and a manifest recording, per
+        file, how many bytes were tokenized and the SHA-1 of those bytes; an appended file is tokenized from where the
+        last update stopped, a file whose tokenized part changed is tokenized again from scratch
+        corpus files are read as UTF-8; a last line without a trailing newline is counted too, but kept out of the
+        manifest and recorded as the file's `tail` counts, which the next update subtracts before reading on from the
+        last complete line, so the store always matches count_tokens() on the current contents
+        :param directory: str, directory of the store, created on the first save
+        """
+        self.directory = directory
+        self.manifest, self.file_counters = {}, {}
+        self._token_counter = None
+
+        manifest_path = os.path.join(directory, TokenStore.manifest_file)
+        counts_path = os.path.join(directory, TokenStore.counts_file)
+        if os.path.exists(manifest_path) and os.path.exists(counts_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            with gzip.open(counts_path, "rt", encoding="utf-8") as f:
+                self.file_counters = {file: Counter(counts) for file, counts in json.load(f).items()}
+
+    def save(self):
+        """write the snapshot and the manifest, each one atomically"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        counts_path = os.path.join(self.directory, TokenStore.counts_file)
+        with gzip.open(counts_path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(self.file_counters, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(counts_path + ".tmp", counts_path)
+
+        manifest_path = os.path.join(self.directory, TokenStore.manifest_file)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def update(self, path="corpus.txt", chunk_size=1 << 20, callback=None, save=True):
+        """
+        bring the store up to date with a corpus, tokenizing only new or changed content
+        files that are no longer part of the corpus are dropped from the store
+        :param path: str, path to a corpus file or to a directory of corpus files; or a list of such paths
+        :param chunk_size: int, approximate number of characters tokenized at a time
+        :param callback: callable or None, called as in count_tokens() after each chunk, per file
+        :param save: bool, whether to save the store afterwards
+        :return: self
+        """
+        files = [os.path.abspath(file) for file in corpus_files(path)]
+        for file in set(self.manifest) - set(files):
+            del self.manifest[file]
+            self.file_counters.pop(file, None)
+
+        for file in files:
+            self._update_file(file, chunk_size, callback)
+
+        self._token_counter = None
+        if save:
+            self.save()
+        return self
+
+    def _update_file(self, file, chunk_size, callback):
+        """tokenize the part of one file not covered by the manifest, from scratch if the covered part changed"""
+        entry = self.manifest.get(file, {"offset": 0, "sha1": hashlib.sha1().hexdigest()})
+        hasher, offset = hashlib.sha1(), 0
+
+        with open(file, "rb") as f:
+            remaining = entry["offset"]
+            while remaining:
+                block = f.read(min(remaining, 1 << 20))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+
+            if remaining == 0 and hasher.hexdigest() == entry["sha1"]:
+                offset = entry["offset"]
+                counter = self.file_counters.setdefault(file, Counter())
+                counter.subtract(entry.get("tail", {}))  # the partial last line is tokenized again below
+                counter += Counter()  # drop the tokens whose count fell to zero
+                self.file_counters[file] = counter
+            else:  # the tokenized part changed: start over
+                f.seek(0)
+                hasher = hashlib.sha1()
+                counter = self.file_counters[file] = Counter()
+
+            partial = b""
+
+            def complete_lines():
+                nonlocal offset, partial
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        partial = line
+                        break
+                    hasher.update(line)
+                    offset += len(line)
+                    yield _universal_newlines(line.decode("utf-8"))
+
+            n_chars, n_tokens, start = 0, 0, time.perf_counter()
+            for chunk in iter_chunks(complete_lines(), chunk_size):
+                for token in jieba.cut(chunk):
+                    counter[token] += 1
+                    n_tokens += 1
+                n_chars += len(chunk)
+                if callback is not None:
+                    callback(n_chars, n_tokens, time.perf_counter() - start)
+
+            # a character still being written may be cut short, so undecodable trailing bytes are skipped
+            tail = Counter()
+            for chunk in iter_chunks([_universal_newlines(partial.decode("utf-8", errors="ignore"))], chunk_size):
+                tail.update(jieba.cut(chunk))
+            counter.update(tail)
+
+        self.manifest[file] = {"offset": offset, "sha1": hasher.hexdigest(), "tail": dict(tail)}
+
+    @property
+    def token_counter(self):
+        """fetch the token counts of the whole corpus, merged from the per-file counters"""
+        if self._token_counter is None:
+            self._token_counter = Counter()
+            for counter in self.file_counters.values():
+                self._token_counter.update(counter)
+        return self._token_counter
+
+
+def print_progress(n_chars, n_tokens, seconds):
+    """progress callback for count_tokens() that reports throughput on stderr"""
+    print("{} chars, {} tokens, {:.0f} chars/s".format(n_chars, n_tokens, n_chars / max(seconds, 1e-9)),
+          end="\r", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--corpus", default="corpus.txt", help="path to a corpus file or directory of corpora")
+    parser.add_argument("-n", "--names", default="name-list.txt", help="path to the name list")
+    parser.add_argument("-w", "--workers", default=1, type=int, help="number of tokenizing processes")
+    parser.add_argument("-e", "--engine", default="jieba", choices=["jieba", "automaton"],
+                        help="count jieba tokens, or match names directly with an Aho-Corasick automaton")
+    parser.add_argument("-s", "--store", default=None,
+                        help="directory of a persisted token store, to only tokenize what changed since the last run")
+    parser.add_argument("-k", "--top", default=30, type=int, help="number of names to print")
+    args = parser.parse_args()
+
+    names = load_names(args.names)
+
+    if args.engine == "automaton":
+        matcher = NameMatcher(names)
+        name_counter = matcher.name_counts(matcher.count_corpus(args.corpus, callback=print_progress))
+        print(file=sys.stderr)
+    elif args.store is not None:
+        token_counter = TokenStore(args.store).update(args.corpus, callback=print_progress).token_counter
+        print(file=sys.stderr)
+        name_counter = NameIndex(names).name_counts(token_counter)
+    else:
+        if args.workers > 1:
+            token_counter = count_tokens_parallel(args.corpus, n_workers=args.workers, callback=print_progress)
+        else:
+            token_counter = count_tokens(args.corpus, callback=print_progress)
+        print(file=sys.stderr)
+        name_counter = NameIndex(names).name_counts(token_counter)
 
-    n_entries = 30
-    for name, count in ordered_name_counter[:n_entries]:
+    for name, count in top_names(name_counter, args.top):
         print(name, count)
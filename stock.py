@@ -1,61 +1,318 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+import time
 import pandas as pd
 import numpy as np
 import tushare as ts
 
 
+# outcome of DataFetcher.fetch(): codes fetched, codes that failed, code -> last exception, and wall time in seconds
+FetchReport = namedtuple("FetchReport", ["succeeded", "failed", "errors", "seconds"])
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=1):
+        """
+        thread-safe token bucket limiting calls to `rate` per second, allowing bursts of `burst` calls
+        :param rate: float, sustained number of calls per second
+        :param burst: int, number of calls that may be made back to back after an idle period
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive, got {}".format(rate))
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """block until a call is allowed"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class StockCache:
+    def __init__(self, directory=".stock_cache", ttl=24 * 3600):
+        """
+        local cache of tushare data, one columnar .npz file per table (one array per column plus a JSON header)
+        k-line frames are cached per code along with the date range they cover; a request for a wider range only fetches
+        the missing days before and after it; entries older than `ttl` are fetched again from scratch
+        :param directory: str, directory of the cache, created on first use
+        :param ttl: float, time to live of an entry in seconds
+        """
+        self.directory = directory
+        self.ttl = ttl
+
+    @staticmethod
+    def _save(path, df, meta):
+        """write a frame column by column, along with a JSON-serializable header, atomically"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        columns = {}
+        for i, col in enumerate(df.columns):
+            values = df[col].to_numpy()
+            if values.dtype == object:  # strings are stored fixed-width, with a mask of the missing values
+                nulls = pd.isna(values)
+                columns["null{}".format(i)] = nulls
+                values = np.where(nulls, "", values).astype(str)
+            columns["col{}".format(i)] = values
+        header = dict(meta, columns=[str(col) for col in df.columns], fetched_at=meta.get("fetched_at", time.time()))
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, __header__=np.array(json.dumps(header)), **columns)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _load(path):
+        """read a frame written by StockCache._save(), returning (frame, header)"""
+        with np.load(path) as data:
+            header = json.loads(str(data["__header__"]))
+            columns = {}
+            for i, col in enumerate(header["columns"]):
+                values = data["col{}".format(i)]
+                if "null{}".format(i) in data.files:
+                    values = values.astype(object)
+                    values[data["null{}".format(i)]] = None
+                columns[col] = values
+            df = pd.DataFrame(columns, columns=header["columns"])
+        return df, header
+
+    def _is_fresh(self, header):
+        """whether a cached entry is younger than the time to live"""
+        return time.time() - header["fetched_at"] <= self.ttl
+
+    def concepts(self, fetch_fn=None):
+        """
+        fetch the concept classification of the stocks, from the cache if fresh
+        :param fetch_fn: callable with the signature of ts.get_concept_classified, defaults to it
+        :return: pd.DataFrame
+        """
+        path = os.path.join(self.directory, "concepts.npz")
+        if os.path.exists(path):
+            df, header = StockCache._load(path)
+            if self._is_fresh(header):
+                return df
+
+        df = (fetch_fn or ts.get_concept_classified)()
+        StockCache._save(path, df, {})
+        return df
+
+    def k_data(self, code, start, end, fetch_fn=None, **kwargs):
+        """
+        fetch the k-line data of a code between two dates, only requesting the days the cache does not cover
+        requests with an open date range (start or end None) bypass the cache
+        :param code: str, stock code
+        :param start: str, first date, e.g. "2019-01-01"
+        :param end: str, last date
+        :param fetch_fn: callable with the signature of ts.get_k_data, defaults to it
+        :param kwargs: keyword arguments passed on to `fetch_fn`, part of the cache key
+        :return: pd.DataFrame
+        """
+        fetch_fn = fetch_fn or ts.get_k_data
+        if start is None or end is None:
+            return fetch_fn(code, start, end, **kwargs)
+
+        key = hashlib.sha1(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()[:12]
+        path = os.path.join(self.directory, "k", "{}_{}.npz".format(code, key))
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        day = pd.Timedelta(days=1)
+
+        def fetch(first, last):
+            """fetch a date range; a result other than a pd.DataFrame (tushare's soft failure) is returned as None"""
+            result = fetch_fn(code, first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d"), **kwargs)
+            return result if isinstance(result, pd.DataFrame) else None
+
+        cached, meta = None, None
+        if os.path.exists(path):
+            cached, meta = StockCache._load(path)
+            if not self._is_fresh(meta):
+                cached, meta = None, None
+
+        # a range is recorded as covered once its fetch returned a frame, even an empty one (e.g. over a weekend);
+        # a soft failure (None) or a raised error is not cached, so that the range is asked again next time
+        if cached is None:
+            df = fetch(start, end)
+            if df is None:
+                return df
+            meta = {"start": start.strftime("%Y-%m-%d"), "end": end.strftime("%Y-%m-%d"), "fetched_at": time.time()}
+            frames, changed = [df], True
+        else:
+            frames, changed = [cached], False
+            covered_start, covered_end = pd.Timestamp(meta["start"]), pd.Timestamp(meta["end"])
+            if start < covered_start:
+                frame = fetch(start, covered_start - day)
+                if frame is not None:
+                    frames.append(frame)
+                    meta, changed = dict(meta, start=start.strftime("%Y-%m-%d")), True
+            if end > covered_end:
+                frame = fetch(covered_end + day, end)
+                if frame is not None:
+                    frames.append(frame)
+                    meta, changed = dict(meta, end=end.strftime("%Y-%m-%d")), True
+
+        if not changed:
+            df = cached
+        else:
+            frames = [frame for frame in frames if frame.shape[0] > 0] or frames[:1]
+            df = pd.concat(frames, ignore_index=True)
+            if "date" in df.columns:
+                df = df.drop_duplicates("date").sort_values("date").reset_index(drop=True)
+            StockCache._save(path, df, meta)
+
+        if "date" not in df.columns:
+            return df
+        dates = pd.to_datetime(df["date"])
+        return df[(dates >= start) & (dates <= end)].reset_index(drop=True)
+
+
 class StockBase:
-    def __init__(self):
+    # columns that filters and groupings look up; each is stored as a categorical with a prebuilt row index
+    index_columns = ("name", "c_name", "code")
+
+    def __init__(self, cache=None):
+        """
+        universe of stocks and their concepts
+        the concept table is held once; filters are a stack of boolean row masks over it, so filtering and resetting
+        never copy the table, and a filtered frame is only materialized when `concepts` is read
+        :param cache: StockCache or None, local cache of the concept table
+        """
         # self.industries = ts.get_industry_classified()
-        self._concepts = ts.get_concept_classified()  # type: pd.DataFrame
-        self._accessible_concepts = self._concepts.copy()  # type: pd.DataFrame
+        concepts = ts.get_concept_classified() if cache is None else cache.concepts()  # type: pd.DataFrame
+        self._concepts = concepts.astype({column: "category" for column in self.index_columns
+                                          if column in concepts.columns})
+        self._row_index = {column: self._concepts.groupby(column, observed=True, sort=False).indices
+                           for column in self.index_columns if column in self._concepts.columns}
+        self._all = np.ones(self._concepts.shape[0], dtype=bool)
+        self._masks = [self._all]
+        self._view = self._concepts
+
+        # rows ordered by c_name, and where each c_name starts in that order, for single-pass grouping;
+        # rows without a c_name (code -1) belong to no group, as with np.unique before
+        if "c_name" in self._concepts.columns:
+            c_name_codes = self._concepts.c_name.cat.codes.to_numpy()
+            named = np.flatnonzero(c_name_codes >= 0)
+            self._c_name_order = named[np.argsort(c_name_codes[named], kind="stable")]
+            self._c_name_bounds = np.flatnonzero(np.diff(c_name_codes[self._c_name_order])) + 1
+
+    @property
+    def mask(self):
+        """
+        :return: np.ndarray of bool, rows of the concept table that pass the current filters; do not modify
+        """
+        return self._masks[-1]
 
     @property
     def concepts(self):
-        return self._accessible_concepts
+        if self._view is None:
+            self._view = self._concepts[self.mask]
+        return self._view
+
+    def _column(self, column):
+        values = self._concepts[column]
+        if self.mask is not self._all:
+            values = values[self.mask]
+        return values.to_numpy(dtype=object)  # missing values come back as NaN, not as a category
 
     @property
     def names(self):
-        return self._accessible_concepts.name.values
+        return self._column("name")
 
     @property
     def c_names(self):
-        return self._accessible_concepts.c_name.values
+        return self._column("c_name")
 
     @property
     def codes(self):
-        return self._accessible_concepts.code.values
+        return self._column("code")
 
     @property
     def shape(self):
-        return self._accessible_concepts.shape
+        return int(self.mask.sum()), self._concepts.shape[1]
 
     @property
     def index(self):
-        return self._accessible_concepts.index
+        return self._concepts.index if self.mask is self._all else self._concepts.index[self.mask]
+
+    def _push(self, mask):
+        self._masks.append(mask)
+        self._view = None
 
     def filter_by(self, name=None, c_name=None, code=None):
-        mask = pd.Series(np.ones(self.shape[0], dtype=np.bool))
-        if name is not None:
-            mask = mask & (self._accessible_concepts.name == name)
-        if c_name is not None:
-            mask = mask & (self._accessible_concepts.c_name == c_name)
-        if code is not None:
-            mask = mask & (self._accessible_concepts.code == code)
-
-        self._accessible_concepts = self._accessible_concepts[mask]
+        """
+        keep only the rows matching all the given values, on top of the current filters
+        :param name: str or None, stock name
+        :param c_name: str or None, concept name
+        :param code: str or None, stock code
+        :return: self, so that filters can be chained
+        """
+        mask = self.mask
+        for column, value in (("name", name), ("c_name", c_name), ("code", code)):
+            if value is None:
+                continue
+            rows = self._row_index[column].get(value, np.empty(0, dtype=np.intp))
+            narrowed = np.zeros_like(mask)
+            narrowed[rows] = mask[rows]
+            mask = narrowed
+
+        if mask is not self.mask:
+            self._push(mask)
+        return self
+
+    def pop_filter(self):
+        """
+        undo the last filter_by() that narrowed the rows
+        :return: self
+        """
+        if len(self._masks) > 1:
+            self._masks.pop()
+            self._view = self._concepts if len(self._masks) == 1 else None
         return self
 
     def grouped_by_c_names(self):
-        df = self._accessible_concepts
-        return [df[df.c_name == c_name] for c_name in np.unique(self.c_names)]
+        """
+        split the filtered rows by concept, in one pass over the rows
+        :return: list of pd.DataFrame, one per concept present, ordered by concept name
+        """
+        groups = np.split(self._c_name_order, self._c_name_bounds)
+        if self.mask is not self._all:
+            groups = [rows[self.mask[rows]] for rows in groups]
+        return [self._concepts.take(rows) for rows in groups if len(rows)]
 
     def reset_filter(self):
-        self._accessible_concepts = self._concepts.copy()
+        del self._masks[1:]
+        self._view = self._concepts
         return self
 
 
 class DataFetcher:
-    def __init__(self, stocks, start=None, end=None, **kwargs):
+    def __init__(self, stocks, start=None, end=None, max_workers=1, rate_limit=None, max_retries=2, backoff=0.5,
+                 fetch_fn=None, cache=None, **kwargs):
+        """
+        fetcher of the k-line data of a set of stocks
+        codes are fetched on a pool of `max_workers` threads, each call waiting for the rate limiter and retried with
+        exponential backoff; a code that still fails is reported in self.errors instead of aborting the whole fetch
+        :param stocks: pd.DataFrame or pd.Series with a `code` column
+        :param start: str or None, first date, e.g. "2019-01-01"
+        :param end: str or None, last date
+        :param max_workers: int, number of concurrent requests
+        :param rate_limit: float or None, maximal number of requests per second, across all threads
+        :param max_retries: int, number of retries of a failing request
+        :param backoff: float, delay in seconds before the first retry, doubled on each further retry
+        :param fetch_fn: callable with the signature of ts.get_k_data, defaults to ts.get_k_data
+        :param cache: StockCache or None; if given, only the days it does not cover are requested
+        :param kwargs: keyword arguments passed on to `fetch_fn`
+        """
         if isinstance(stocks, pd.Series):
             self.stocks = stocks.to_frame()
         elif isinstance(stocks, pd.DataFrame):
@@ -65,11 +322,60 @@ class DataFetcher:
 
         self.start = start
         self.end = end
+        self.max_workers = max_workers
+        self.rate_limiter = None if rate_limit is None else RateLimiter(rate_limit)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.fetch_fn = fetch_fn
+        self.cache = cache
         self.kwargs = kwargs
+        self.errors = {}
         self._k = None
 
+    def _request(self, code, start, end, **kwargs):
+        """make one request for k-line data, once the rate limiter allows it"""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return (self.fetch_fn or ts.get_k_data)(code, start, end, **kwargs)
+
+    def _fetch_one(self, code):
+        """fetch the k-line data of one code, retrying with exponential backoff; raises the last error"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.cache is not None:
+                    return self.cache.k_data(code, self.start, self.end, fetch_fn=self._request, **self.kwargs)
+                return self._request(code, self.start, self.end, **self.kwargs)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _fetch_or_error(self, code):
+        """fetch one code, returning (data, None) on success and (None, exception) on failure"""
+        try:
+            return self._fetch_one(code), None
+        except Exception as e:
+            return None, e
+
+    def fetch(self):
+        """
+        fetch the k-line data of every code, keeping whatever succeeded
+        :return: FetchReport
+        """
+        start = time.perf_counter()
+        codes = list(dict.fromkeys(self.stocks.code.dropna()))
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(self.max_workers) as executor:
+                results = list(executor.map(self._fetch_or_error, codes))
+        else:
+            results = [self._fetch_or_error(code) for code in codes]
+
+        self._k = {code: data for code, (data, error) in zip(codes, results) if error is None}
+        self.errors = {code: error for code, (data, error) in zip(codes, results) if error is not None}
+        return FetchReport(list(self._k), list(self.errors), dict(self.errors), time.perf_counter() - start)
+
     def _fetch_k(self):
-        self._k = {code: ts.get_k_data(code, self.start, self.end, **self.kwargs) for code in self.stocks.code}
+        self.fetch()
 
     @property
     def k(self):
@@ -79,18 +385,85 @@ class DataFetcher:
 
 
 class DataParser:
-    def __init__(self, data_dict: dict, clean=True):
+    def __init__(self, data_dict: dict, clean=True, date_column="date"):
+        """
+        date-aligned panel of the k-line data of many stocks
+        the numeric columns of every frame are copied once into a float array of shape (field, date, code), indexed by
+        the union of all dates; days a stock has no data for are NaN
+        :param data_dict: dict, code -> pd.DataFrame with a date column, e.g. DataFetcher.k
+        :param clean: bool, whether to drop entries that are not non-empty pd.DataFrame
+        :param date_column: str, column holding the date of each row
+        """
         self.data = data_dict
 
         if clean:
             self.data = {k: v for k, v in self.data.items() if isinstance(v, pd.DataFrame) and v.shape[0] > 0}
 
+        self.date_column = date_column
+        self.codes = pd.Index(list(self.data), name="code")
+        self.fields = pd.Index(list(dict.fromkeys(
+            column for df in self.data.values() for column in df.select_dtypes("number").columns
+            if column != date_column
+        )), name="field")
+        row_dates = {code: pd.DatetimeIndex(pd.to_datetime(df[date_column])) for code, df in self.data.items()}
+        self.dates = pd.DatetimeIndex(sorted(set().union(*row_dates.values())), name=date_column)
+
+        self.values = np.full((len(self.fields), len(self.dates), len(self.codes)), np.nan)
+        for j, (code, df) in enumerate(self.data.items()):
+            rows = self.dates.get_indexer(row_dates[code])
+            fields = self.fields.get_indexer(df.columns)
+            present = fields >= 0
+            self.values[fields[present][:, None], rows, j] = df.loc[:, present].to_numpy(dtype=float).T
+
+    @property
+    def mask(self):
+        """
+        :return: np.ndarray of bool with the shape of self.values, True where a stock has data for the day
+        """
+        return ~np.isnan(self.values)
+
     def get_column(self, col):
-        return {code: df[col] for code, df in self.data.items()}
+        """
+        :param col: str, a numeric field, e.g. "close"
+        :return: pd.DataFrame, dates x codes, backed by the panel without copying
+        """
+        return pd.DataFrame(self.values[self.fields.get_loc(col)], index=self.dates, columns=self.codes, copy=False)
 
     def get_by_columns(self, *cols):
-        cols = list(cols)
-        return {code: df[cols] for code, df in self.data.items()}
+        """
+        :param cols: str, numeric fields
+        :return: pd.DataFrame, dates x (code, field) columns
+        """
+        fields = self.fields.get_indexer(list(cols))
+        if (fields < 0).any():
+            raise KeyError([col for col, i in zip(cols, fields) if i < 0])
+
+        values = self.values[fields].transpose(1, 2, 0).reshape(len(self.dates), -1)
+        columns = pd.MultiIndex.from_product([self.codes, self.fields[fields]])
+        return pd.DataFrame(values, index=self.dates, columns=columns)
+
+    def returns(self, col="close", log=False):
+        """
+        day-over-day returns of every stock; a return next to a missing day is NaN
+        :param col: str, price field
+        :param log: bool, whether to compute log returns instead of simple returns
+        :return: pd.DataFrame, dates x codes, the first date being all NaN
+        """
+        prices = self.values[self.fields.get_loc(col)]
+        returns = np.full_like(prices, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns[1:] = np.log(prices[1:] / prices[:-1]) if log else prices[1:] / prices[:-1] - 1
+        return pd.DataFrame(returns, index=self.dates, columns=self.codes, copy=False)
+
+    def correlation(self, col="close", log=False, min_periods=2):
+        """
+        pairwise correlation of the returns of every stock, over the days both have a return
+        :param col: str, price field
+        :param log: bool, whether to correlate log returns
+        :param min_periods: int, minimal number of shared days, below which the correlation is NaN
+        :return: pd.DataFrame, codes x codes
+        """
+        return self.returns(col, log).corr(min_periods=min_periods)
 
 
 if __name__ == '__main__':